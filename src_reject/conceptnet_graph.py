@@ -0,0 +1,157 @@
+import json, os
+import numpy as np
+import scipy.sparse
+
+
+class ConceptNetGraph():
+    # undirected ConceptNet graph over interned node ids: node i is uris[i] (utf-8 bytes, sorted),
+    # its neighbours are indices[indptr[i]:indptr[i + 1]] (CSR), relations[k] is the bitmask of the
+    # relation_names of the edge indices[k]
+
+    def __init__(self, uris, indptr, indices, relations=None, relation_names=None):
+        self.uris = uris
+        self.indptr = indptr
+        self.indices = indices
+        self.relations = relations
+        self.relation_names = relation_names
+        assert self.indptr.shape[0] == self.uris.shape[0] + 1
+        assert self.indptr[-1] == self.indices.shape[0]
+        assert self.relations is None or self.relations.shape == self.indices.shape
+
+    def __len__(self):
+        return self.uris.shape[0]
+
+    def __contains__(self, uri):
+        return self.get_id(uri) >= 0
+
+    def num_edges(self):
+        # each undirected edge is stored in both directions
+        return self.indices.shape[0] // 2
+
+    def get_id(self, uri):
+        key = uri.encode("utf-8")
+        idx = np.searchsorted(self.uris, key)
+        if idx < self.uris.shape[0] and self.uris[idx] == key:
+            return int(idx)
+        return -1
+
+    def get_ids(self, uri_list):
+        id_list = [self.get_id(uri) for uri in uri_list]
+        for uri, node_id in zip(uri_list, id_list):
+            assert node_id >= 0, "Invalid node " + uri
+        return np.array(id_list, dtype=np.int64)
+
+    def get_uri(self, node_id):
+        return self.uris[node_id].decode("utf-8")
+
+    def get_uris(self, node_ids):
+        return [uri.decode("utf-8") for uri in self.uris[node_ids]]
+
+
+def sort_uris(uri_list):
+    # node table in the order used by ConceptNetGraph
+    return np.sort(np.array([uri.encode("utf-8") for uri in uri_list], dtype=bytes))
+
+def build_graph(uris, sub_ids, obj_ids, rel_ids=None, relation_names=None):
+    # CSR graph from an edge list of ids into uris; edges are made undirected and de-duplicated,
+    # the relations of duplicated edges are merged into one bitmask
+    num_nodes = uris.shape[0]
+    src = np.concatenate([sub_ids, obj_ids]).astype(np.int64)
+    dst = np.concatenate([obj_ids, sub_ids]).astype(np.int64)
+    keys = src * num_nodes + dst
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]])) if keys.shape[0] > 0 else np.zeros(0, dtype=np.int64)
+    relations = None
+    if rel_ids is not None:
+        assert len(relation_names) <= 64, "too many relations for a 64-bit mask"
+        bits = np.left_shift(np.uint64(1), np.concatenate([rel_ids, rel_ids]).astype(np.uint64))[order]
+        relations = np.bitwise_or.reduceat(bits, starts) if keys.shape[0] > 0 else np.zeros(0, dtype=np.uint64)
+    keys = keys[starts]
+    src = keys // num_nodes
+    dst = keys % num_nodes
+
+    indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=num_nodes), out=indptr[1:])
+    return ConceptNetGraph(uris, indptr, dst.astype(np.int32), relations, relation_names)
+
+def save_graph(graph, graph_dir):
+    np.save(graph_dir + "nodes.npy", graph.uris)
+    np.save(graph_dir + "indptr.npy", graph.indptr)
+    np.save(graph_dir + "indices.npy", graph.indices)
+    if graph.relations is not None:
+        np.save(graph_dir + "relations.npy", graph.relations)
+        with open(graph_dir + "relation_names.json", "w") as f:
+            json.dump(graph.relation_names, f)
+
+def load_graph(graph_dir):
+    relations = None
+    relation_names = None
+    if os.path.exists(graph_dir + "relations.npy"):
+        relations = np.load(graph_dir + "relations.npy", mmap_mode = "r")
+        with open(graph_dir + "relation_names.json") as f:
+            relation_names = json.load(f)
+    return ConceptNetGraph(np.load(graph_dir + "nodes.npy", mmap_mode = "r"),
+                           np.load(graph_dir + "indptr.npy", mmap_mode = "r"),
+                           np.load(graph_dir + "indices.npy", mmap_mode = "r"),
+                           relations, relation_names)
+
+
+class SparseHopEngine():
+    # hop features on a sparse adjacency matrix of the graph restricted to rel_list (None = all relations);
+    # each cluster node is one column of the frontier matrix, so all cluster nodes are expanded together
+
+    def __init__(self, graph, rel_list=None):
+        self.graph = graph
+        num_nodes = len(graph)
+        indptr = graph.indptr
+        indices = graph.indices
+        if rel_list is not None:
+            assert graph.relations is not None, "the graph has no relations"
+            mask = np.uint64(0)
+            for rel in rel_list:
+                assert rel in graph.relation_names, "relation %s not in the graph" % rel
+                mask |= np.uint64(1) << np.uint64(graph.relation_names.index(rel))
+            keep = (np.asarray(graph.relations) & mask) != 0
+            indptr = np.concatenate([[0], np.cumsum(keep)])[np.asarray(graph.indptr)]
+            indices = np.asarray(graph.indices)[keep]
+        # without a relation filter the mmapped CSR arrays of the graph are used as they are
+        self.adjacency = scipy.sparse.csr_matrix((np.ones(indices.shape[0], dtype=np.int32), indices, indptr), shape=(num_nodes, num_nodes))
+
+    def neighbors_within(self, source_ids, hop):
+        frontier = np.zeros(len(self.graph), dtype=bool)
+        frontier[np.asarray(source_ids, dtype=np.int64)] = True
+        visited = frontier.copy()
+        for h in range(hop):
+            frontier = (self.adjacency.dot(frontier.astype(np.int32)) > 0) & ~visited
+            visited |= frontier
+        return np.nonzero(visited)[0]
+
+    def hop_counts(self, source_ids, node_ids, hop):
+        # counts[k, h] = no. of source nodes whose hop distance to node_ids[k] is h + 1
+        source_ids = np.asarray(source_ids, dtype=np.int64)
+        num_nodes = len(self.graph)
+        counts = np.zeros((node_ids.shape[0], hop))
+        ones = np.ones(source_ids.shape[0], dtype=np.int32)
+        frontier = scipy.sparse.csr_matrix((ones, (source_ids, np.arange(source_ids.shape[0]))), shape=(num_nodes, source_ids.shape[0]))
+        visited = frontier.copy()
+        for h in range(hop):
+            reached = self.adjacency.dot(frontier)
+            reached.data[:] = 1
+            frontier = reached - reached.multiply(visited)
+            frontier.eliminate_zeros()
+            visited = visited + frontier
+            counts[:, h] = np.asarray(frontier[node_ids].sum(axis=1)).ravel()
+        return counts
+
+    def get_vectors_of(self, node_ids, source_ids, hop):
+        # KG vector of each node for one group of cluster nodes: [in cluster, (any, sum, mean) for each hop]
+        v = np.zeros((node_ids.shape[0], 3 * hop + 1))
+        if len(source_ids) == 0:
+            return v
+        v[:, 0] = np.isin(node_ids, source_ids)
+        counts = self.hop_counts(source_ids, node_ids, hop)
+        v[:, 1::3] = counts > 0
+        v[:, 2::3] = counts
+        v[:, 3::3] = counts / len(source_ids)
+        return v
@@ -1,5 +1,5 @@
 
-import argparse
+import argparse, json, os
 
 parser = argparse.ArgumentParser(description='configurations')
 parser.add_argument("--data",  type=str, required=False, help="dataset: dbpedia or 20news")
@@ -18,6 +18,14 @@ parser.add_argument("--fulltest", type=int, required=False, help="full test or n
 parser.add_argument("--threshold", type=float, required=False, help="threshold for seen")
 parser.add_argument("--nott", type=int, required=False, help="no. of original texts to be translated")
 parser.add_argument("--naug", type=int, default = 0, required=False, help="no. of augmented data per unseen class")
+parser.add_argument("--workers", type=int, default=1, required=False, help="number of worker processes for data preprocessing, by default 1 (serial)")
+parser.add_argument("--pipeline", type=int, default=0, required=False, help="build training batches with a tf.data pipeline (parallel map + prefetch) or not, by default 0")
+parser.add_argument("--embedgraph", type=int, default=0, required=False, help="feed token ids and look up the word embedding in the graph or not, by default 0")
+parser.add_argument("--bucket", type=int, default=0, required=False, help="length-bucketed batching with variable time length or not (cnn models only), by default 0")
+parser.add_argument("--kgupdate", type=int, default=0, required=False, help="only generate KG vectors for new or changed classes or not, by default 0 (all classes)")
+parser.add_argument("--kgvocab", type=int, default=0, required=False, help="only output KG vectors of nodes that match a word in the dataset vocab or not, by default 0")
+parser.add_argument("--transtable", type=int, default=0, required=False, help="precompute the topic translation of every vocab word for each class pair or not, by default 0")
+parser.add_argument("--grammar", type=str, default="lazy", required=False, help="grammar correction of translated texts: off, lazy (in process) or pool (batches to worker processes), by default lazy")
 args = parser.parse_args()
 print(args)
 
@@ -61,6 +69,15 @@ model = args.model
 negative_sample = args.ns
 negative_increase = args.ni
 small_epoch = args.sepoch
+
+input_pipeline = bool(args.pipeline)
+pipeline_num_parallel_calls = 4
+pipeline_prefetch = 4
+
+embedding_in_graph = bool(args.embedgraph)
+
+bucket_batching = bool(args.bucket)
+bucket_window = 50 # no. of batches sorted by length together
 # dbpedia
 # negative_sample = 5
 # negative_increase = 3
@@ -79,7 +96,7 @@ small_epoch = args.sepoch
 word_embedding_dim = 200
 hidden_dim = 256
 
-# TODO if updating kg_vector file, you may need to change this also
+# default only, it is read from the meta.json written by kg_vector_generation.py (see the end of this file)
 # kg_embedding_dim = 10 # kg_vector cluster allgroup
 kg_embedding_dim = 30 # kg_vector cluster 3group
 # kg_embedding_dim = 400 # kg_vector hop=2
@@ -88,6 +105,9 @@ kg_embedding_dim = 30 # kg_vector cluster 3group
 # prepro_min_word_count = 5 # wiki
 prepro_min_word_count = 100 # arxiv
 prepro_max_sentence_length = max_length
+prepro_num_workers = args.workers
+prepro_chunk_size = 2000
+prepro_csv_chunk_size = 20000 # rows per chunk when streaming a csv to count words
 
 cstep_print = 100
 cstep_print_unseen = 50
@@ -112,10 +132,26 @@ pos_dict = {'JJ': 'a', 'JJR': 'a', 'JJS': 'a',
 # kg_vector_data_path = kg_vector_dir + "KG_VECTORS_2.pickle"
 
 word_embed_file_path = "../data/glove/glove.6B.200d.txt"
-word_embed_gensim_file_path = '../data/glove/glove.6B.200d.gensim.txt'
-conceptnet_path = "../data/conceptnet-assertions-en-5.6.0.csv"
-POS_OF_WORD_path = "../data/POS_OF_WORD.pickle"
+conceptnet_path = "../data/conceptnet-assertions-en-5.6.0.csv" # or the original .csv.gz
+conceptnet_rel_list = ['/r/IsA', '/r/PartOf', '/r/AtLocation', '/r/RelatedTo']
+conceptnet_min_weight = 1.0
+conceptnet_snapshot_dir = "../data/conceptnet_graph/" # binary graph snapshots, shared by all datasets
+conceptnet_lemma_cache_path = "../data/conceptnet_lemma_cache.tsv" # label -> lemmatised uri
+conceptnet_lemma_chunk_size = 20000 # labels per pos_tag batch
+kg_vector_hop = 3
+kg_vector_rel_list = None # subset of conceptnet_rel_list for the hop features, None = all
+kg_vector_incremental = bool(args.kgupdate)
+kg_vector_vocab_pruning = bool(args.kgvocab)
+augment_cache_path = "../data/augment_cache.sqlite" # POS_OF_WORD and WORD_TOPIC_TRANSLATION of topic_translation.py
+POS_OF_WORD_path = "../data/POS_OF_WORD.pickle" # old pickled caches, imported into augment_cache_path
 WORD_TOPIC_TRANSLATION_path = "../data/WORD_TOPIC_TRANSLATION.pickle"
+topic_translation_topn = 20
+topic_translation_batch_size = 64 # words scored against the whole GloVe matrix at once
+topic_translation_tables = bool(args.transtable)
+augment_seed = 2019 # row order of the sharded augment_train
+grammar_correction = args.grammar
+grammar_num_workers = 4 # LanguageTool processes in the pool mode
+grammar_cache_path = "../data/grammar_cache.sqlite"
 
 '''
 if dataset in ["dbpedia", "20news"] and unseen_rate in [0.25, 0.5, 0.75]:
@@ -183,14 +219,16 @@ zhang15_dbpedia_full_data_path = zhang15_dbpedia_dir + "full.csv"
 zhang15_dbpedia_full_augmented_path = zhang15_dbpedia_dir + "full_augmented.csv"
 
 zhang15_dbpedia_train_path = zhang15_dbpedia_dir + "train.csv"
-zhang15_dbpedia_train_processed_path = zhang15_dbpedia_dir + "processed_train_text.pkl"
+zhang15_dbpedia_train_processed_path = zhang15_dbpedia_dir + "processed_train_text.npy"
 
 zhang15_dbpedia_train_augmented_path = zhang15_dbpedia_dir + "train_augmented.csv"
 zhang15_dbpedia_train_augmented_aggregated_path = zhang15_dbpedia_dir + "train_augmented_aggregated.csv"
-zhang15_dbpedia_train_augmented_processed_path = zhang15_dbpedia_dir + "processed_train_augmented_text.pkl"
+zhang15_dbpedia_train_augmented_processed_path = zhang15_dbpedia_dir + "processed_train_augmented_text.npy"
+zhang15_dbpedia_translation_table_dir = zhang15_dbpedia_dir + "TOPIC_TRANSLATION_TABLE/"
+zhang15_dbpedia_train_analysis_path = zhang15_dbpedia_dir + "train_text_analysis.sqlite"
 
 zhang15_dbpedia_test_path = zhang15_dbpedia_dir + "test.csv"
-zhang15_dbpedia_test_processed_path = zhang15_dbpedia_dir + "processed_test_text.pkl"
+zhang15_dbpedia_test_processed_path = zhang15_dbpedia_dir + "processed_test_text.npy"
 
 zhang15_dbpedia_vocab_path = zhang15_dbpedia_dir + "vocab.txt"
 
@@ -206,9 +244,9 @@ zhang15_dbpedia_class_random_group_path = zhang15_dbpedia_dir + "dbpedia_random_
 
 # zhang15_dbpedia_kg_vector_dir = zhang15_dbpedia_dir + "KG_VECTOR_3/"
 # zhang15_dbpedia_kg_vector_prefix = "KG_VECTORS_3_"
-zhang15_dbpedia_kg_vector_node_data_path = zhang15_dbpedia_dir + 'NODES_DATA.pickle'
 zhang15_dbpedia_kg_vector_dir = zhang15_dbpedia_dir + "KG_VECTOR_CLUSTER_3GROUP/"
 zhang15_dbpedia_kg_vector_prefix = "VECTORS_CLUSTER_3_"
+zhang15_dbpedia_kg_vector_table_path = zhang15_dbpedia_dir + "kg_vector_table_lemma.npy"
 
 zhang15_dbpedia_word_embed_matrix_path = zhang15_dbpedia_dir + "word_embed_matrix.npz"
 
@@ -291,23 +329,38 @@ news20_class_random_group_path = news20_dir + "20news_random_group_%s.txt" % uns
 news20_full_data_path = news20_dir + "full.csv"
 
 news20_train_path = news20_dir + "train.csv"
-news20_train_processed_path = news20_dir + "processed_train_text.pkl"
+news20_train_processed_path = news20_dir + "processed_train_text.npy"
 
 news20_test_path = news20_dir + "test.csv"
-news20_test_processed_path = news20_dir + "processed_test_text.pkl"
+news20_test_processed_path = news20_dir + "processed_test_text.npy"
 
 news20_train_augmented_path = news20_dir + "train_augmented.csv"
 news20_train_augmented_aggregated_path = news20_dir + "train_augmented_aggregated.csv"
-news20_train_augmented_processed_path = news20_dir + "processed_train_augmented_text.pkl"
+news20_train_augmented_processed_path = news20_dir + "processed_train_augmented_text.npy"
+news20_translation_table_dir = news20_dir + "TOPIC_TRANSLATION_TABLE/"
+news20_train_analysis_path = news20_dir + "train_text_analysis.sqlite"
 
 
 news20_vocab_path = news20_dir + "vocab.txt"
 
-news20_kg_vector_node_data_path = news20_dir + 'NODES_DATA.pickle'
 news20_kg_vector_dir = news20_dir + "KG_VECTOR_CLUSTER_3GROUP/"
 news20_kg_vector_prefix = "VECTORS_CLUSTER_3_"
+news20_kg_vector_table_path = news20_dir + "kg_vector_table_lemma.npy"
 
 news20_word_embed_matrix_path = news20_dir + "word_embed_matrix.npz"
 
 # news20_class_cluster_path = news20_dir + "class_clusters_20news.pickle"
 
+##################################
+
+if dataset == "dbpedia":
+    kg_vector_meta_path = zhang15_dbpedia_kg_vector_dir + zhang15_dbpedia_kg_vector_prefix + "meta.json"
+elif dataset == "20news":
+    kg_vector_meta_path = news20_kg_vector_dir + news20_kg_vector_prefix + "meta.json"
+else:
+    kg_vector_meta_path = None
+
+if kg_vector_meta_path is not None and os.path.exists(kg_vector_meta_path):
+    with open(kg_vector_meta_path) as f:
+        kg_embedding_dim = json.load(f)["kg_embedding_dim"]
+    print("kg_embedding_dim %d from %s" % (kg_embedding_dim, kg_vector_meta_path))
@@ -1,8 +1,14 @@
 
 import os
 import re
+import json
 import pickle
+import hashlib
 import random
+import itertools
+import threading
+import collections
+import multiprocessing
 import numpy as np
 import pandas as pd
 import tensorflow as tf
@@ -39,30 +45,114 @@ def check_df(filename):
     # df.to_csv(filename)
     return nan
 
-def preprocess(textlist):
+def preprocess_text(text):
+    text = re.sub(r'[\W_]+', ' ', text)
+    return tl.nlp.process_sentence(text, start_word=START_ID, end_word=END_ID)
+
+def preprocess(textlist, vocab=None, num_workers=config.prepro_num_workers, chunk_size=config.prepro_chunk_size):
+    if num_workers > 1:
+        return map_chunks_parallel(preprocess_chunk, textlist, vocab, num_workers, chunk_size)
+
     print("Preprocessing ...")
     with progressbar.ProgressBar(max_value=len(textlist)) as bar:
         for idx, text in enumerate(textlist):
             # textlist[idx].replace(",", " ")
             # textlist[idx].replace(".", " ")
-            textlist[idx] = re.sub(r'[\W_]+', ' ', textlist[idx])
-            textlist[idx] = tl.nlp.process_sentence(textlist[idx], start_word=START_ID, end_word=END_ID)
+            textlist[idx] = preprocess_text(textlist[idx])
             # textlist[idx] = textlist[idx].split() # no empty string in the list
             bar.update(idx + 1)
 
+    if vocab is not None:
+        textlist = sentence_word_to_id(textlist, vocab, num_workers=1)
     return textlist
 
 def create_vocab_given_text(textlist, vocab_path, min_word_count=config.prepro_min_word_count):
     # create dictionary
-    tl.nlp.create_vocab(textlist, word_counts_output_file=vocab_path, min_word_count=min_word_count)
+    word_counter = collections.Counter()
+    for text in textlist:
+        word_counter.update(text)
+    return create_vocab_given_counter(word_counter, vocab_path, min_word_count)
+
+def create_vocab_given_counter(word_counter, vocab_path, min_word_count=config.prepro_min_word_count):
+    # same file as tl.nlp.create_vocab: "<PAD> 0" first, then words by count descending,
+    # ties kept in order of first occurrence
+    word_counts = [item for item in word_counter.items() if item[1] >= min_word_count]
+    word_counts.sort(key=lambda item: item[1], reverse=True)
+    word_counts = [("<PAD>", 0)] + word_counts
+    with open(vocab_path, "w") as f:
+        f.write("\n".join(["%s %d" % (word, count) for word, count in word_counts]))
+    print("Vocab: %d words in total, %d words kept (min_word_count %d)" % (len(word_counter), len(word_counts) - 1, min_word_count))
     vocab = tl.nlp.Vocabulary(vocab_path, start_word=START_ID, end_word=END_ID, unk_word=UNK_ID)
     return vocab
 
-def sentence_word_to_id(textlist, vocab):
+def count_words_chunk(textlist):
+    word_counter = collections.Counter()
+    for text in textlist:
+        word_counter.update(preprocess_text(text))
+    return word_counter
+
+def count_words_from_csv(filename, column, num_workers=config.prepro_num_workers, chunk_size=config.prepro_csv_chunk_size):
+    # streams the csv chunk by chunk, so memory is bounded by the vocab instead of the corpus;
+    # partial counters are merged in chunk order, which keeps the first occurrence order of words
+    print("Counting words in %s with %d workers, chunk size %d ..." % (filename, num_workers, chunk_size))
+    word_counter = collections.Counter()
+    text_chunks = (get_text_list(df, column) for df in pd.read_csv(filename, index_col=0, chunksize=chunk_size))
+
+    with progressbar.ProgressBar(max_value=progressbar.UnknownLength) as bar:
+        if num_workers > 1:
+            # at most 2 chunks per worker in flight, as Pool.imap would read the whole csv ahead
+            pending = collections.deque()
+            with multiprocessing.Pool(num_workers) as pool:
+                for idx, textlist in enumerate(text_chunks):
+                    pending.append(pool.apply_async(count_words_chunk, (textlist, )))
+                    if len(pending) >= 2 * num_workers:
+                        word_counter.update(pending.popleft().get())
+                    bar.update(idx + 1)
+                while len(pending) > 0:
+                    word_counter.update(pending.popleft().get())
+        else:
+            for idx, textlist in enumerate(text_chunks):
+                word_counter.update(count_words_chunk(textlist))
+                bar.update(idx + 1)
+
+    return word_counter
+
+def sentence_word_to_id(textlist, vocab, num_workers=config.prepro_num_workers, chunk_size=config.prepro_chunk_size):
+    if num_workers > 1:
+        return map_chunks_parallel(word_to_id_chunk, textlist, vocab, num_workers, chunk_size)
+
     for idx, text in enumerate(textlist):
         textlist[idx] = [vocab.word_to_id(word) for word in text]
     return textlist
 
+# vocab of the current worker process, set once by the pool initializer instead of pickled per chunk
+WORKER_VOCAB = None
+
+def init_worker_vocab(vocab):
+    global WORKER_VOCAB
+    WORKER_VOCAB = vocab
+
+def preprocess_chunk(textlist):
+    textlist = [preprocess_text(text) for text in textlist]
+    if WORKER_VOCAB is not None:
+        textlist = word_to_id_chunk(textlist)
+    return textlist
+
+def word_to_id_chunk(textlist):
+    return [[WORKER_VOCAB.word_to_id(word) for word in text] for text in textlist]
+
+def map_chunks_parallel(chunk_fn, textlist, vocab, num_workers, chunk_size):
+    print("Preprocessing with %d workers, chunk size %d ..." % (num_workers, chunk_size))
+    chunks = [textlist[idx : idx + chunk_size] for idx in range(0, len(textlist), chunk_size)]
+    result = list()
+    with multiprocessing.Pool(num_workers, initializer=init_worker_vocab, initargs=(vocab,)) as pool:
+        with progressbar.ProgressBar(max_value=len(chunks)) as bar:
+            # imap keeps chunks in submission order, so the output matches the serial path
+            for idx, chunk in enumerate(pool.imap(chunk_fn, chunks)):
+                result.extend(chunk)
+                bar.update(idx + 1)
+    return result
+
 # def prepro_encode_kg_vector(kg_vector_list):
 #     for idx, kg_vector in enumerate(kg_vector_list):
 #         new_kg_vector = np.zeros([config.max_length, config.kg_embedding_dim])
@@ -81,17 +171,140 @@ def get_text_list(df, column):
         raise Exception("column should be either a string or a list of string")
     return full_text_list
 
+class RaggedSeqs():
+    # read-only view of a tokenized corpus stored as one flat token array plus offsets,
+    # document i is tokens[offsets[i]:offsets[i + 1]]; selections share the same buffers
+
+    def __init__(self, tokens, offsets, index=None):
+        self.tokens = tokens
+        self.offsets = offsets
+        self.index = index
+
+    def __len__(self):
+        if self.index is None:
+            return len(self.offsets) - 1
+        return len(self.index)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return self.take(np.arange(len(self))[idx])
+        if idx < 0:
+            idx += len(self)
+        if idx < 0 or idx >= len(self):
+            raise IndexError("document index %d out of range" % idx)
+        doc = idx if self.index is None else self.index[idx]
+        return self.tokens[self.offsets[doc]:self.offsets[doc + 1]]
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def __add__(self, other):
+        if len(other) == 0:
+            return self
+        return concat_text_seqs([self, other])
+
+    def __radd__(self, other):
+        if len(other) == 0:
+            return self
+        return concat_text_seqs([other, self])
+
+    def take(self, idx_list):
+        doc_ids = np.asarray(idx_list, dtype=np.int64)
+        if self.index is not None:
+            doc_ids = self.index[doc_ids]
+        return RaggedSeqs(self.tokens, self.offsets, doc_ids)
+
+    def lengths(self):
+        if self.index is None:
+            return np.diff(self.offsets)
+        return self.offsets[self.index + 1] - self.offsets[self.index]
+
+    def flat_tokens(self):
+        # tokens of the documents in order, without the documents that are not selected
+        if self.index is None:
+            return np.asarray(self.tokens[self.offsets[0]:self.offsets[-1]])
+        if len(self) == 0:
+            return np.zeros(0, dtype=np.int32)
+        return np.concatenate([self[idx] for idx in range(len(self))])
+
+def concat_text_seqs(text_seqs_list):
+    # one RaggedSeqs over new flat buffers, the parts are RaggedSeqs or lists of token lists
+    tokens_list = list()
+    lengths_list = list()
+    for text_seqs in text_seqs_list:
+        if isinstance(text_seqs, RaggedSeqs):
+            lengths = text_seqs.lengths()
+            tokens_list.append(text_seqs.flat_tokens())
+        else:
+            lengths = np.array([len(text) for text in text_seqs], dtype=np.int64)
+            tokens_list.append(np.fromiter(itertools.chain.from_iterable(text_seqs), dtype=np.int32, count=int(lengths.sum())))
+        lengths_list.append(lengths)
+    lengths = np.concatenate(lengths_list)
+    offsets = np.zeros(lengths.shape[0] + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return RaggedSeqs(np.concatenate(tokens_list).astype(np.int32), offsets)
+
+def get_offsets_path(processed_file):
+    return processed_file[:-len(".npy")] + "_offsets.npy"
+
+def save_ragged_seqs(text_seqs, processed_file):
+    offsets = np.zeros(len(text_seqs) + 1, dtype=np.int64)
+    np.cumsum([len(text) for text in text_seqs], out=offsets[1:])
+    tokens = np.fromiter(itertools.chain.from_iterable(text_seqs), dtype=np.int32, count=offsets[-1])
+    # written under temporary names and renamed, offsets first: the token file is the marker of a complete corpus
+    offsets_file = get_offsets_path(processed_file)
+    np.save(offsets_file + ".tmp.npy", offsets)
+    np.save(processed_file + ".tmp.npy", tokens)
+    os.replace(offsets_file + ".tmp.npy", offsets_file)
+    os.replace(processed_file + ".tmp.npy", processed_file)
+
+def load_ragged_seqs(processed_file):
+    tokens = np.load(processed_file, mmap_mode="r")
+    offsets = np.load(get_offsets_path(processed_file), mmap_mode="r")
+    assert offsets[-1] == tokens.shape[0]
+    return RaggedSeqs(tokens, offsets)
+
+def select_text_seqs(text_seqs, idx_list):
+    if isinstance(text_seqs, RaggedSeqs):
+        return text_seqs.take(idx_list)
+    return [text_seqs[idx] for idx in idx_list]
+
+def save_processed_text(text_seqs, processed_file):
+    if processed_file.endswith(".npy"):
+        save_ragged_seqs(text_seqs, processed_file)
+    elif processed_file.endswith(".pkl"):
+        with open(processed_file, "wb") as f:
+            pickle.dump(text_seqs, f)
+    else:
+        with open(processed_file, "w") as f:
+            f.write(str(text_seqs))
+    print("Processed data saved to %s" % processed_file)
+
+def load_processed_text(processed_file):
+    if processed_file.endswith(".npy"):
+        return load_ragged_seqs(processed_file)
+    elif processed_file.endswith(".pkl"):
+        with open(processed_file, 'rb') as f:
+            return pickle.load(f)
+    else:
+        with open(processed_file, "r") as f:
+            return eval(f.read())
+
+def check_processed_text(processed_file):
+    # a corpus processed before the switch to .npy is converted once instead of being re-tokenized
+    legacy_file = processed_file[:-len(".npy")] + ".pkl"
+    if not os.path.exists(processed_file) and processed_file.endswith(".npy") and os.path.exists(legacy_file):
+        print("Converting %s to %s" % (legacy_file, processed_file))
+        save_processed_text(load_processed_text(legacy_file), processed_file)
+    return os.path.exists(processed_file)
+
 def load_data(filename, vocab_file, processed_file, column, min_word_count=config.prepro_min_word_count, force_process=False):
     print("Loading data ...")
 
-    if not force_process and os.path.exists(processed_file) and os.path.exists(vocab_file):
+    if not force_process and check_processed_text(processed_file) and os.path.exists(vocab_file):
         print("Processed data found in local files. Loading ...")
-        if processed_file.endswith(".pkl"):
-            with open(processed_file, 'rb') as f:
-                full_text_list = pickle.load(f)
-        else:
-            with open(processed_file, "r") as f:
-                full_text_list = eval(f.read())
+        full_text_list = load_processed_text(processed_file)
         vocab = tl.nlp.Vocabulary(vocab_file, start_word=START_ID, end_word=END_ID, unk_word=UNK_ID)
     else:
         df = pd.read_csv(filename, index_col=0)
@@ -101,13 +314,8 @@ def load_data(filename, vocab_file, processed_file, column, min_word_count=confi
         vocab = create_vocab_given_text(full_text_list, vocab_path=vocab_file, min_word_count=min_word_count)
         full_text_list = sentence_word_to_id(full_text_list, vocab)
 
-        if processed_file.endswith(".pkl"):
-            with open(processed_file, "wb") as f:
-                pickle.dump(full_text_list, f)
-        else:
-            with open(processed_file, "w") as f:
-                f.write(str(full_text_list))
-        print("Processed data saved to %s" % processed_file)
+        save_processed_text(full_text_list, processed_file)
+        full_text_list = load_processed_text(processed_file)
 
     print("Data loaded: num of seqs %s" % len(full_text_list))
     return full_text_list, vocab
@@ -118,11 +326,8 @@ def build_vocabulary_from_full_corpus(filename, vocab_file, column, min_word_cou
         vocab = tl.nlp.Vocabulary(vocab_file, start_word=START_ID, end_word=END_ID, unk_word=UNK_ID)
     else:
         print("Creating vocab ...")
-        df = pd.read_csv(filename, index_col=0)
-
-        full_text_list = get_text_list(df, column)
-        full_text_list = preprocess(full_text_list)
-        vocab = create_vocab_given_text(full_text_list, vocab_path=vocab_file, min_word_count=min_word_count)
+        word_counter = count_words_from_csv(filename, column)
+        vocab = create_vocab_given_counter(word_counter, vocab_path=vocab_file, min_word_count=min_word_count)
         print("Vocab created and saved in %s" % vocab_file)
     return vocab
 
@@ -143,14 +348,9 @@ def load_class_dict(class_file, class_code_column, class_name_column):
 def load_data_from_text_given_vocab(filename, vocab, processed_file, column, force_process=False):
     print("Loading data given vocab ...")
 
-    if not force_process and os.path.exists(processed_file):
+    if not force_process and check_processed_text(processed_file):
         print("Processed data found in local files. Loading ...")
-        if processed_file.endswith(".pkl"):
-            with open(processed_file, 'rb') as f:
-                full_text_list = pickle.load(f)
-        else:
-            with open(processed_file, "r") as f:
-                full_text_list = eval(f.read())
+        full_text_list = load_processed_text(processed_file)
 
     else:
 
@@ -160,16 +360,10 @@ def load_data_from_text_given_vocab(filename, vocab, processed_file, column, for
             df = pd.read_csv(filename, index_col=0, encoding="latin-1")
 
         full_text_list = get_text_list(df, column)
-        full_text_list = preprocess(full_text_list)
-        full_text_list = sentence_word_to_id(full_text_list, vocab)
+        full_text_list = preprocess(full_text_list, vocab=vocab)
 
-        if processed_file.endswith(".pkl"):
-            with open(processed_file, "wb") as f:
-                pickle.dump(full_text_list, f)
-        else:
-            with open(processed_file, "w") as f:
-                f.write(str(full_text_list))
-        print("Processed data saved to %s" % processed_file)
+        save_processed_text(full_text_list, processed_file)
+        full_text_list = load_processed_text(processed_file)
 
     print("Data loaded: num of seqs %s" % len(full_text_list))
     return full_text_list
@@ -192,26 +386,173 @@ def get_kg_vector(kg_vector_dict, class_label, word):
             return kg_vector_dict[class_label][word]
         return np.zeros(config.kg_embedding_dim)
 
+# the pipeline threads may open the same class at once; one conversion at a time
+CLASS_KG_VECTOR_LOCK = threading.Lock()
+
+class ClassKGVectors():
+    # KG vectors of one class as sorted node uris (utf-8 bytes) plus one feature matrix, both
+    # memory-mapped on first access; behaves like the pickled {uri: vector} dict for lookups
+
+    def __init__(self, class_file, version=None):
+        self.class_file = class_file
+        self.version = version # hash of the class in the KG vector manifest, None if not recorded
+        self.uris = None
+        self.vectors = None
+
+    def open(self):
+        if self.uris is None:
+            with CLASS_KG_VECTOR_LOCK:
+                if self.uris is None:
+                    uri_file, vector_file = get_class_kg_vector_paths(self.class_file)
+                    if not os.path.exists(uri_file):
+                        convert_class_kg_vector(self.class_file)
+                    self.vectors = np.load(vector_file, mmap_mode="r")
+                    uris = np.load(uri_file, mmap_mode="r")
+                    assert uris.shape[0] == self.vectors.shape[0]
+                    # set last: other threads only check self.uris before using both arrays
+                    self.uris = uris
+        return self
+
+    def find(self, uri):
+        if not isinstance(uri, str):
+            return -1
+        self.open()
+        key = uri.encode("utf-8")
+        idx = np.searchsorted(self.uris, key)
+        if idx < self.uris.shape[0] and self.uris[idx] == key:
+            return idx
+        return -1
+
+    def __contains__(self, uri):
+        return self.find(uri) >= 0
+
+    def __getitem__(self, uri):
+        idx = self.find(uri)
+        if idx < 0:
+            raise KeyError(uri)
+        return np.array(self.vectors[idx])
+
+    def __len__(self):
+        return self.open().uris.shape[0]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        return [uri.decode("utf-8") for uri in self.open().uris]
+
+    def values(self):
+        return self.open().vectors
+
+    def items(self):
+        return zip(self.keys(), self.values())
+
+    def get_version(self):
+        if self.version is not None:
+            return self.version
+        # no manifest entry: the size and mtime of the files the vectors are read from
+        uri_file, vector_file = get_class_kg_vector_paths(self.class_file)
+        files = [uri_file, vector_file] if os.path.exists(uri_file) else [self.class_file + ".pickle"]
+        return [[os.stat(filename).st_size, int(os.stat(filename).st_mtime)] for filename in files]
+
+def get_class_kg_vector_paths(class_file):
+    return class_file + ".uris.npy", class_file + ".vectors.npy"
+
+def convert_class_kg_vector(class_file):
+    print("Converting %s.pickle ..." % class_file)
+    with open(class_file + ".pickle", 'rb') as f:
+        class_kg_dict = pickle.load(f)
+    save_class_kg_vector(class_kg_dict, class_file)
+
+def save_class_kg_vector(class_kg_dict, class_file):
+    uri_file, vector_file = get_class_kg_vector_paths(class_file)
+    uri_list = sorted(class_kg_dict.keys(), key=lambda uri: uri.encode("utf-8"))
+    vectors = np.zeros([len(uri_list), config.kg_embedding_dim])
+    for idx, uri in enumerate(uri_list):
+        vectors[idx, :] = class_kg_dict[uri]
+    # written under temporary names of this process and renamed, uris last: the uri file is the marker of a complete conversion
+    tmp_suffix = ".tmp%d.npy" % os.getpid()
+    np.save(vector_file + tmp_suffix, vectors)
+    np.save(uri_file + tmp_suffix, np.array([uri.encode("utf-8") for uri in uri_list], dtype=bytes))
+    os.replace(vector_file + tmp_suffix, vector_file)
+    os.replace(uri_file + tmp_suffix, uri_file)
+
 def load_kg_vector(filedir, fileprefix, class_dict):
     print("Loading KG_VECTOR ...")
     kg_vector_dict = dict()
+    manifest = dict()
+    if os.path.exists(filedir + fileprefix + "manifest.json"):
+        with open(filedir + fileprefix + "manifest.json") as f:
+            manifest = json.load(f)
     for class_id in class_dict:
 
-        with open("%s%s%s.pickle" % (filedir, fileprefix, class_dict[class_id]), 'rb') as f:
-            class_kg_dict = pickle.load(f)
+        # nothing is read before the first lookup of the class
+        class_file = "%s%s%s" % (filedir, fileprefix, class_dict[class_id])
+        assert os.path.exists(get_class_kg_vector_paths(class_file)[0]) or os.path.exists(class_file + ".pickle"), "KG_VECTOR of %s not found" % class_file
+        class_kg_dict = ClassKGVectors(class_file, manifest.get(class_dict[class_id]))
 
-            prefix = "/c/en/"
-            class_name = class_dict[class_id]
-            if not class_name.startswith(prefix):
-                class_name = prefix + class_name
+        prefix = "/c/en/"
+        class_name = class_dict[class_id]
+        if not class_name.startswith(prefix):
+            class_name = prefix + class_name
 
-            assert class_name not in kg_vector_dict
-            kg_vector_dict[class_name] = class_kg_dict
+        assert class_name not in kg_vector_dict
+        kg_vector_dict[class_name] = class_kg_dict
 
     print(kg_vector_dict.keys())
     return kg_vector_dict
 
+def get_kg_vector_table_key(kg_vector_dict, class_dict, word_list):
+    # the table is rebuilt when the looked up words, the classes or their KG vectors change
+    key = [[[class_id, class_dict[class_id]] for class_id in sorted(class_dict.keys())],
+           [[class_name, kg_vector_dict[class_name].get_version()] if isinstance(kg_vector_dict[class_name], ClassKGVectors) else [class_name, None]
+            for class_name in sorted(kg_vector_dict.keys())],
+           config.kg_embedding_dim,
+           hashlib.md5("\n".join(word_list).encode("utf-8")).hexdigest()]
+    return hashlib.md5(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+
+def load_kg_vector_table(kg_vector_dict, class_dict, vocab, table_file, word_fn=None, force_process=False):
+    # precomputed get_kg_vector for every (class, word id): table[class_idx, word_id] where
+    # class_idx follows sorted(class_dict); word_fn maps a vocab word to the word to look up
+    class_id_list = sorted(class_dict.keys())
+    table_shape = (len(class_id_list), len(vocab.reverse_vocab), config.kg_embedding_dim)
+    word_list = [vocab.id_to_word(word_id) for word_id in range(table_shape[1])]
+    if word_fn is not None:
+        word_list = [word_fn(word) for word in word_list]
+    table_key = get_kg_vector_table_key(kg_vector_dict, class_dict, word_list)
+
+    if not force_process and os.path.exists(table_file) and os.path.exists(table_file + ".key"):
+        with open(table_file + ".key") as f:
+            saved_key = f.read().strip()
+        if saved_key == table_key:
+            kg_vector_table = np.load(table_file, mmap_mode="r")
+            assert kg_vector_table.shape == table_shape
+            print("KG_VECTOR table loaded from %s: %s" % (table_file, kg_vector_table.shape))
+            return kg_vector_table
+        print("KG_VECTOR table %s is out of date, rebuilding ..." % table_file)
+
+    print("Building KG_VECTOR table ...")
+    kg_vector_table = np.zeros(table_shape, dtype=np.float32)
+    with progressbar.ProgressBar(max_value=len(class_id_list)) as bar:
+        for class_idx, class_id in enumerate(class_id_list):
+            for word_id, word in enumerate(word_list):
+                kg_vector_table[class_idx, word_id, :] = get_kg_vector(kg_vector_dict, class_dict[class_id], word)
+            bar.update(class_idx + 1)
+
+    # written under temporary names and renamed, the key last, so that a reader never sees a partial table
+    np.save(table_file + ".tmp.npy", kg_vector_table)
+    os.replace(table_file + ".tmp.npy", table_file)
+    with open(table_file + ".key.tmp", "w") as f:
+        f.write(table_key)
+    os.replace(table_file + ".key.tmp", table_file + ".key")
+    del kg_vector_table
+    kg_vector_table = np.load(table_file, mmap_mode="r")
+    print("KG_VECTOR table saved in %s: %s" % (table_file, kg_vector_table.shape))
+    return kg_vector_table
+
 def load_kg_vector_given_text_seqs(text_seqs, vocab, class_dict, kg_vector_dict, processed_file, force_process=False):
+    # not used by the training scripts: the per-document KG vectors are a gather from the class x vocab table,
+    # load_kg_vector_table(...)[class_idx, text], which needs no storage per document
 
     print("Loading KG Vector ...")
     if not force_process and os.path.exists(processed_file):
@@ -235,6 +576,45 @@ def load_kg_vector_given_text_seqs(text_seqs, vocab, class_dict, kg_vector_dict,
             pickle.dump(kg_vector_seqs, f)
     return kg_vector_seqs
 
+def get_glove_store_paths(filename):
+    return filename[:-4] + ".npy", filename[:-4] + ".words.txt"
+
+def convert_glove_to_store(filename, matrix_file, words_file):
+    # one-off conversion of the glove text file into a float32 .npy matrix and a word list (one word per row)
+    print("Converting Glove %s into %s ..." % (filename, matrix_file))
+    with open(filename, 'r', encoding="utf8") as f:
+        num_words = sum(1 for _ in f)
+
+    glove_words = list()
+    glove_store = np.lib.format.open_memmap(matrix_file + ".tmp", mode="w+", dtype=np.float32, shape=(num_words, config.word_embedding_dim))
+    with progressbar.ProgressBar(max_value=num_words) as bar:
+        with open(filename, 'r', encoding="utf8") as f:
+            for idx, line in enumerate(f):
+                content = line.replace("\n", "").split(" ")
+                glove_words.append(content[0])
+                glove_store[idx, :] = np.array(content[1:]).astype(np.float32)
+                bar.update(idx + 1)
+    glove_store.flush()
+    del glove_store
+
+    with open(words_file + ".tmp", 'w', encoding="utf8") as f:
+        f.write("\n".join(glove_words))
+    os.replace(matrix_file + ".tmp", matrix_file)
+    os.replace(words_file + ".tmp", words_file)
+
+def load_glove_store(filename):
+    matrix_file, words_file = get_glove_store_paths(filename)
+    if not os.path.exists(matrix_file) or not os.path.exists(words_file):
+        convert_glove_to_store(filename, matrix_file, words_file)
+
+    glove_store = np.load(matrix_file, mmap_mode="r")
+    with open(words_file, 'r', encoding="utf8") as f:
+        glove_words = f.read().split("\n")
+    assert len(glove_words) == glove_store.shape[0]
+    # later duplicates win, as with the line by line filling
+    glove_index = dict(zip(glove_words, range(len(glove_words))))
+    return glove_store, glove_words, glove_index
+
 def load_glove_word_vector(filename, npzfilename, vocab, force_process=False):
     print("Glove loading ... ")
 
@@ -244,23 +624,15 @@ def load_glove_word_vector(filename, npzfilename, vocab, force_process=False):
         print("Glove loaded: mat %s, vocab size %d" % (glove_mat.shape, np.count_nonzero(np.sum(glove_mat, axis=1))))
 
     else:
+        glove_store, _, glove_index = load_glove_store(filename)
         glove_mat = np.zeros((vocab.unk_id + 1, config.word_embedding_dim))
 
-        num = 0
-        with progressbar.ProgressBar(max_value=400000) as bar:
-            with open(filename, 'r') as f:
-                for idx, line in enumerate(f):
-                    content = line.replace("\n", "").split(" ")
+        word_id_list = [word_id for word_id in range(vocab.unk_id) if vocab.reverse_vocab[word_id] in glove_index]
+        row_list = [glove_index[vocab.reverse_vocab[word_id]] for word_id in word_id_list]
+        glove_mat[word_id_list, :] = glove_store[row_list]
+        num = len(word_id_list)
 
-                    word = content[0]
-                    vect = np.array(content[1:]).astype(np.float32)
-
-                    word_id = vocab.word_to_id(word)
-                    if word_id != vocab.unk_id:
-                        glove_mat[word_id, : ] = vect
-                        num += 1
-                    bar.update(idx + 1)
-            np.savez(npzfilename, matrix=glove_mat)
+        np.savez(npzfilename, matrix=glove_mat)
         print("Glove loaded: mat %s, vocab size %d" % (glove_mat.shape, num))
 
     return glove_mat
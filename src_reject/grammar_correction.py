@@ -0,0 +1,107 @@
+import hashlib, multiprocessing, time
+
+import config
+import kv_cache
+
+# post-processing of translated sentences with LanguageTool
+#   off:  sentences are returned unchanged
+#   lazy: corrected in this process, the tool is started on the first sentence
+#   pool: batches of sentences are corrected by config.grammar_num_workers processes, each with its own tool
+# corrections are cached by sentence hash in config.grammar_cache_path
+
+TOOL = None
+POOL = None
+CACHE = None
+STATS = {"sentences": 0, "cached": 0, "corrected": 0, "failed": 0, "seconds": 0.0}
+
+
+def get_tool():
+    global TOOL
+    if TOOL is None:
+        import language_check
+        start_time = time.time()
+        TOOL = language_check.LanguageTool('en-US')
+        print("LanguageTool started in %.2fs" % (time.time() - start_time))
+    return TOOL
+
+def get_cache():
+    global CACHE
+    if CACHE is None:
+        CACHE = kv_cache.PersistentCache(config.grammar_cache_path, "grammar_correction")
+    return CACHE
+
+def get_pool():
+    global POOL
+    if POOL is None:
+        POOL = multiprocessing.Pool(config.grammar_num_workers)
+    return POOL
+
+def get_key(sentence):
+    return hashlib.md5(sentence.encode("utf-8")).hexdigest()
+
+def correct_uncached(sentence):
+    import language_check
+    matches = get_tool().check(sentence)
+    return language_check.correct(sentence, matches)
+
+def correct_or_none(sentence): # for the pool, a failed sentence does not fail the batch
+    get_tool() # a tool that cannot start fails the whole batch
+    try:
+        return correct_uncached(sentence)
+    except Exception:
+        return None
+
+def correct_batch(sentences, mode=config.grammar_correction):
+    # corrected sentences in the same order, None for a sentence whose correction failed
+    if mode == "off":
+        return list(sentences)
+    assert mode in ["lazy", "pool"], "unknown grammar correction mode %s" % mode
+
+    cache = get_cache()
+    ans = [cache.get(get_key(sentence)) for sentence in sentences]
+    todo = [idx for idx, corrected in enumerate(ans) if corrected is None]
+    STATS["sentences"] += len(sentences)
+    STATS["cached"] += len(sentences) - len(todo)
+
+    start_time = time.time()
+    # workers of another pool (e.g. sharded augment_train) cannot start a pool of their own
+    if mode == "pool" and len(todo) > 1 and not multiprocessing.current_process().daemon:
+        corrected = get_pool().map(correct_or_none, [sentences[idx] for idx in todo])
+    else:
+        corrected = [correct_or_none(sentences[idx]) for idx in todo]
+    STATS["seconds"] += time.time() - start_time
+
+    for idx, sentence in zip(todo, corrected):
+        if sentence is None:
+            STATS["failed"] += 1
+            continue
+        STATS["corrected"] += 1
+        cache[get_key(sentences[idx])] = sentence
+        ans[idx] = sentence
+    return ans
+
+def correct(sentence, mode=config.grammar_correction):
+    if mode == "off":
+        return sentence
+    ans = correct_batch([sentence], mode)[0]
+    if ans is None:
+        raise Exception("Grammar correction failed: %s" % sentence)
+    return ans
+
+def flush():
+    if CACHE is not None:
+        CACHE.flush()
+
+def close():
+    global POOL
+    if POOL is not None:
+        POOL.close()
+        POOL.join()
+        POOL = None
+
+def report():
+    if STATS["sentences"] == 0:
+        return
+    print("Grammar correction (%s): %d sentences, %d cached, %d corrected, %d failed, %.2fs (%.4fs per corrected sentence)" % (
+        config.grammar_correction, STATS["sentences"], STATS["cached"], STATS["corrected"], STATS["failed"],
+        STATS["seconds"], STATS["seconds"] / max(STATS["corrected"] + STATS["failed"], 1)))
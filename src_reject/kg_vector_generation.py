@@ -1,10 +1,11 @@
-import pickle, json, requests, csv, copy, os, re
+import pickle, json, requests, csv, copy, os, re, gzip, hashlib, shutil, multiprocessing
 import numpy as np
 import pprint as pp
 import urllib.request, urllib.parse
 from sklearn.metrics.pairwise import cosine_similarity
 from json import JSONDecodeError
 from text_to_uri import *
+from conceptnet_graph import SparseHopEngine, sort_uris, build_graph, save_graph, load_graph
 
 import nltk
 from nltk.corpus import stopwords
@@ -24,14 +25,16 @@ pos_dict = {'JJ': 'a', 'JJR': 'a', 'JJS': 'a',
            'RB': 'r', 'RBR': 'r', 'RBS': 'r',
            'VB': 'v', 'VBD': 'v', 'VBG': 'v', 'VBN': 'v', 'VBP': 'v', 'VBZ': 'v'}
 
-NODES_DATA = dict()
-lemmatise_dict = dict()
+NODES_DATA = None # ConceptNetGraph of lemmatised nodes, see load_ConceptNet()
+HOP_ENGINE = None
 
 
 ## Functions
 
 ### Category (Class) related functions
 
+CLASS_NODE_GROUPS = ['the_class', 'super_class', 'description'] # order of the groups in a KG vector
+
 class Category:
     
     def __init__(self, label, description, hierarchy): # Create an empty path
@@ -78,53 +81,56 @@ def get_class_info(filename):
         print("Header =", ans[0].keys())
         return ans
 
+def get_class_hash(class_row, snapshot_dir, vocab_path = None): # a class is regenerated when its row, the graph or the vocab changes
+    vocab_key = None
+    if vocab_path is not None:
+        stat = os.stat(vocab_path)
+        vocab_key = [os.path.abspath(vocab_path), stat.st_size, int(stat.st_mtime)]
+    key = json.dumps([class_row['ConceptNet'], class_row['ClassDescription'], class_row['Hierarchy'], os.path.basename(snapshot_dir[:-1]), vocab_key,
+                      config.kg_vector_hop, config.kg_vector_rel_list])
+    return hashlib.md5(key.encode("utf-8")).hexdigest()
+
+def get_kg_vector_meta_path(kg_vector_dir, kg_vector_prefix):
+    return kg_vector_dir + kg_vector_prefix + "meta.json"
+
+def save_kg_vector_meta(kg_vector_dir, kg_vector_prefix, hop, rel_list):
+    # the layout of the class vectors, config.kg_embedding_dim is read from here
+    meta = {"kg_embedding_dim": len(CLASS_NODE_GROUPS) * (3 * hop + 1),
+            "hop": hop,
+            "groups": CLASS_NODE_GROUPS,
+            "rel_list": NODES_DATA.relation_names if rel_list is None else rel_list}
+    with open(get_kg_vector_meta_path(kg_vector_dir, kg_vector_prefix), "w") as f:
+        json.dump(meta, f, indent = 1)
+    print("KG vector layout:", meta)
+
+def get_kg_vector_manifest_path(kg_vector_dir, kg_vector_prefix):
+    return kg_vector_dir + kg_vector_prefix + "manifest.json"
+
+def load_kg_vector_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return dict()
+    with open(manifest_path) as f:
+        return json.load(f)
+
+def save_kg_vector_manifest(manifest, manifest_path):
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent = 1, sort_keys = True)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
 def get_all_nodes_from_label(label):
     ans = []
-    if standardized_uri('en', label) in NODES_DATA:
-        ans.append(standardized_uri('en', label))
+    uri = standardized_uri('en', label)
+    if uri in NODES_DATA:
+        ans.append(uri)
     for token in label.split():
         if token not in stop_words:
-            token = lemmatise_ConceptNet_label(token)
-            if standardized_uri('en', token) in NODES_DATA and standardized_uri('en', token) not in ans:
-                ans.append(standardized_uri('en', token))
+            uri = standardized_uri('en', lemmatise_ConceptNet_label(token))
+            if uri in NODES_DATA and uri not in ans:
+                ans.append(uri)
     return ans
 
 ### ConceptNet (nodes) related functions
 
-class ConceptNet_node:
-    
-    def __init__(self, uri): # Create a node
-        self.uri = remove_word_sense(uri)
-        self.label = uri[uri.rfind('/')+1:]
-        self.neighbors = {0: set([self.uri]),
-                          1: set()}
-        
-    def find_neighbors(self, hop):
-        if hop not in self.neighbors:
-            one_hop_less = self.find_neighbors(hop-1)
-            ans = set()
-            for n in one_hop_less:
-                ans = ans.union(NODES_DATA[n].find_neighbors(1))
-            ans = ans.difference(self.find_neighbors_within(hop-1))
-            self.neighbors[hop] = ans
-            print('Finish finding neighbors of ', self.uri, 'hop =', hop)
-        return self.neighbors[hop]
-    
-    def find_neighbors_within(self, hop):
-        assert hop >= 0, 'Hop number must be non-negative'
-        if hop == 0:
-            return self.neighbors[0]
-        else:
-            return self.find_neighbors(hop).union(self.find_neighbors_within(hop-1))
-
-
-def get_neighbors_of_cluster(node_set, hop):
-    ans = set()
-    for n in node_set:
-        assert n in NODES_DATA, "Invalid node " + n
-        ans = ans.union(NODES_DATA[n].find_neighbors_within(hop))
-    return ans
-
 def remove_word_sense(sub):
     if sub.count('/') > 3:
         if sub.count('/') > 4:
@@ -152,100 +158,260 @@ def lemmatise_ConceptNet_uri(uri):
     lemmatised_label = lemmatise_ConceptNet_label(label)
     return standardized_uri('en', lemmatised_label)
 
-def create_lemmatised_dict(ns): # ns is a set of nodes from read_all_nodes()
-    nodes = dict()
-    for n in tqdm(ns):
-        nodes[n] = lemmatise_ConceptNet_uri(n)
-    return nodes
+def lemmatise_ConceptNet_labels(labels): # same as lemmatise_ConceptNet_label for each label, tagged in one batch
+    ans = list(labels)
+    to_tag = [idx for idx, label in enumerate(labels) if '_' not in label]
+    tagged = nltk.pos_tag_sents([[labels[idx]] for idx in to_tag])
+    for idx, tokens in zip(to_tag, tagged):
+        tag = tokens[0][1]
+        if tag in pos_dict:
+            ans[idx] = lemmatizer.lemmatize(labels[idx], pos_dict[tag])
+    return ans
+
+def lemmatise_chunk(labels):
+    return [standardized_uri('en', label) for label in lemmatise_ConceptNet_labels(labels)]
+
+def load_lemma_cache(filename):
+    cache = dict()
+    if os.path.exists(filename):
+        with open(filename, 'r', encoding = "utf8") as f:
+            for line in f:
+                fields = line.rstrip('\n').split('\t')
+                # the half-written last line of an interrupted run is skipped
+                if not line.endswith('\n') or len(fields) != 2:
+                    continue
+                cache[fields[0]] = fields[1]
+    return cache
+
+def create_lemmatised_dict(ns, num_workers = config.prepro_num_workers, chunk_size = config.conceptnet_lemma_chunk_size): # ns is a collection of nodes from read_ConceptNet()
+    # nodes with the same label are lemmatised to the same uri, labels seen before are read from the cache
+    cache = load_lemma_cache(config.conceptnet_lemma_cache_path)
+    labels = sorted(set(get_label_from_uri(n) for n in ns).difference(cache))
+    print("No. of labels to lemmatise =", len(labels), ", cached =", len(cache))
+    
+    chunks = [labels[idx : idx + chunk_size] for idx in range(0, len(labels), chunk_size)]
+    if num_workers > 1 and len(chunks) > 1:
+        with multiprocessing.Pool(num_workers) as pool:
+            results = list(tqdm(pool.imap(lemmatise_chunk, chunks), total = len(chunks)))
+    else:
+        results = [lemmatise_chunk(chunk) for chunk in tqdm(chunks)]
+    
+    if len(labels) > 0:
+        os.makedirs(os.path.dirname(config.conceptnet_lemma_cache_path) or '.', exist_ok = True)
+        partial_line = False
+        if os.path.exists(config.conceptnet_lemma_cache_path) and os.path.getsize(config.conceptnet_lemma_cache_path) > 0:
+            with open(config.conceptnet_lemma_cache_path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                partial_line = f.read(1) != b'\n'
+        with open(config.conceptnet_lemma_cache_path, 'a', encoding = "utf8") as f:
+            if partial_line: # end it, so the new lines are not joined to it
+                f.write('\n')
+            for chunk, result in zip(chunks, results):
+                for label, uri in zip(chunk, result):
+                    cache[label] = uri
+                    f.write(label + '\t' + uri + '\n')
+    
+    return {n: cache[get_label_from_uri(n)] for n in ns}
 
 ### Loading ConceptNet functions
 
-def read_all_nodes(filename): # get all distinct uri in conceptnet (without part of speech)
-    nodes = set()
-    with open(filename, 'r', encoding = "utf8") as csvfile:
-        reader = csv.reader(csvfile, delimiter='\t')
-        for line in tqdm(reader):
+def open_ConceptNet(filename):
+    if filename.endswith('.gz'):
+        return gzip.open(filename, 'rt', encoding = "utf8")
+    return open(filename, 'r', encoding = "utf8")
+
+def get_edge_weight(details): # details = the json column of an assertion
+    # the weight is the last key of the json, so avoid parsing the whole json for it
+    pos = details.rfind('"weight":')
+    if pos >= 0:
+        try:
+            return float(details[pos+9:].strip().rstrip('}').split(',')[0])
+        except ValueError:
+            pass
+    return json.loads(details)['weight']
+
+def read_ConceptNet(filename, rel_list, min_weight): # one pass over conceptnet
+    # nodes: all distinct english uri (without part of speech) -> raw id
+    # edges: raw ids of english relationships in rel_list with weight >= min_weight, and their relation ids
+    nodes = dict()
+    relations = dict()
+    sub_ids = []
+    obj_ids = []
+    rel_ids = []
+    rel_set = None if rel_list is None else set(rel_list)
+    with open_ConceptNet(filename) as f:
+        for line in tqdm(f):
+            line = line.rstrip('\n').split('\t')
             if not line[2].startswith('/c/en/') or not line[3].startswith('/c/en/'): # only relationships with english nodes
                 continue
-            sub = remove_word_sense(line[2])
-            obj = remove_word_sense(line[3])
-            nodes.add(sub)
-            nodes.add(obj)
-    return nodes
-
-
-def load_one_hop_data(filename, NODES_DATA, rel_list):
-    count_edges = 0
-    with open(filename, 'r', encoding = "utf8") as csvfile:
-        reader = csv.reader(csvfile, delimiter='\t')
-        for line in tqdm(reader):
+            sub = nodes.setdefault(remove_word_sense(line[2]), len(nodes))
+            obj = nodes.setdefault(remove_word_sense(line[3]), len(nodes))
             rel = line[1].strip()
-            if rel_list is None or rel in rel_list:
-                details = json.loads(line[4])
-                w = details['weight']
-                if w < 1.0:
-                    continue
-                if not line[2].startswith('/c/en/') or not line[3].startswith('/c/en/'): # only relationships with english nodes
-                    continue
-                sub = lemmatise_dict[remove_word_sense(line[2])]
-                obj = lemmatise_dict[remove_word_sense(line[3])]
-                if sub != obj:
-                    NODES_DATA[sub].neighbors[1].add(obj)
-                    NODES_DATA[obj].neighbors[1].add(sub)
-                    count_edges += 1
-    print("Total no. of registered edges =", count_edges)
-
+            if rel_set is not None and rel not in rel_set:
+                continue
+            if get_edge_weight(line[4]) < min_weight:
+                continue
+            sub_ids.append(sub)
+            obj_ids.append(obj)
+            rel_ids.append(relations.setdefault(rel, len(relations)))
+    relation_names = sorted(relations, key = relations.get)
+    return nodes, np.array(sub_ids, dtype=np.int32), np.array(obj_ids, dtype=np.int32), np.array(rel_ids, dtype=np.uint8), relation_names
+
+
+CONCEPTNET_SNAPSHOT_VERSION = 2 # 2: edges carry relations
+
+def get_ConceptNet_snapshot_dir(filename, rel_list, min_weight):
+    # a snapshot is keyed by the conceptnet file and the edge filters
+    stat = os.stat(filename)
+    key = json.dumps([CONCEPTNET_SNAPSHOT_VERSION, os.path.abspath(filename), stat.st_size, int(stat.st_mtime),
+                      None if rel_list is None else sorted(rel_list), min_weight])
+    return config.conceptnet_snapshot_dir + hashlib.md5(key.encode("utf-8")).hexdigest()[:16] + "/"
+
+def save_ConceptNet_snapshot(snapshot_dir, meta):
+    tmp_dir = snapshot_dir[:-1] + ".tmp%d/" % os.getpid()
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+    save_graph(NODES_DATA, tmp_dir)
+    with open(tmp_dir + "meta.json", "w") as f:
+        json.dump(meta, f, indent = 1)
+    try:
+        os.rename(tmp_dir, snapshot_dir)
+    except OSError:
+        if not os.path.exists(snapshot_dir):
+            raise
+        # another job saved the same snapshot first, use that one
+        shutil.rmtree(tmp_dir)
+        load_ConceptNet_snapshot(snapshot_dir)
+        return
+    print("ConceptNet snapshot saved to", snapshot_dir)
+
+def load_ConceptNet_snapshot(snapshot_dir):
+    global NODES_DATA, HOP_ENGINE
+    NODES_DATA = load_graph(snapshot_dir)
+    HOP_ENGINE = None
+    print("ConceptNet snapshot loaded from", snapshot_dir)
+    print("No. of all nodes =", len(NODES_DATA), ", no. of distinct edges =", NODES_DATA.num_edges())
 
 def load_ConceptNet():
-    global lemmatise_dict, NODES_DATA
+    global NODES_DATA, HOP_ENGINE
     
     filename = config.conceptnet_path
+    snapshot_dir = get_ConceptNet_snapshot_dir(filename, config.conceptnet_rel_list, config.conceptnet_min_weight)
+    if os.path.exists(snapshot_dir):
+        load_ConceptNet_snapshot(snapshot_dir)
+        return snapshot_dir
     
-    # Find all lemmatised nodes
-    print("Reading all nodes from ConceptNet")
-    ALL_NODES = read_all_nodes(filename)
-    print('Before lemmatising, no. of all nodes = ', len(ALL_NODES))
-    lemmatise_dict = create_lemmatised_dict(ALL_NODES)
-    ALL_NODES = set(lemmatise_dict.values())
-    print('After lemmatising, no. of all nodes = ', len(ALL_NODES))
+    # Read all nodes and one hop data from ConceptNet
+    print("Reading ConceptNet")
+    raw_nodes, sub_ids, obj_ids, rel_ids, relation_names = read_ConceptNet(filename, config.conceptnet_rel_list, config.conceptnet_min_weight)
+    num_raw_nodes = len(raw_nodes)
+    print('Before lemmatising, no. of all nodes = ', num_raw_nodes)
     
-    # Create all lemmatised nodes objects in the process
-    for n in ALL_NODES:
-        NODES_DATA[n] = ConceptNet_node(n)
-    del ALL_NODES
+    # Find all lemmatised nodes and intern them as int ids
+    lemmatise_dict = create_lemmatised_dict(raw_nodes)
+    uris = sort_uris(set(lemmatise_dict.values()))
+    print('After lemmatising, no. of all nodes = ', uris.shape[0])
+    node_index = {uri.decode("utf-8"): idx for idx, uri in enumerate(uris)}
+    raw_to_id = np.empty(len(raw_nodes), dtype=np.int32) # raw id -> interned id
+    for n, i in raw_nodes.items():
+        raw_to_id[i] = node_index[lemmatise_dict[n]]
+    del node_index, raw_nodes, lemmatise_dict
     print('Finish creating lemmatised nodes')
     
-    # Load one hop data from ConceptNet
-    rel_list = ['/r/IsA', '/r/PartOf', '/r/AtLocation', '/r/RelatedTo']
-    load_one_hop_data(filename, NODES_DATA, rel_list)    
-    print('Finish loading one hop data')
+    sub_ids = raw_to_id[sub_ids]
+    obj_ids = raw_to_id[obj_ids]
+    keep = sub_ids != obj_ids
+    print("Total no. of registered edges =", int(np.sum(keep)))
+    NODES_DATA = build_graph(uris, sub_ids[keep], obj_ids[keep], rel_ids[keep], relation_names)
+    HOP_ENGINE = None
+    print('Finish loading one hop data, no. of distinct edges =', NODES_DATA.num_edges())
+    
+    save_ConceptNet_snapshot(snapshot_dir, {"conceptnet_path": os.path.abspath(filename),
+                                            "rel_list": config.conceptnet_rel_list,
+                                            "min_weight": config.conceptnet_min_weight,
+                                            "num_raw_nodes": num_raw_nodes,
+                                            "num_nodes": len(NODES_DATA),
+                                            "num_edges": NODES_DATA.num_edges()})
+    return snapshot_dir
 
 ### Creating KG vector function
 
-def get_vector_of(n, all_c_nodes, hop): # n = uri, c = Category_node
-    v = np.zeros(3 * hop + 1)
-    v[0] = 1.0 if n in all_c_nodes else 0.0
-    for i in range(hop):
-        have_hops = [n in NODES_DATA[c].find_neighbors(i+1) for c in all_c_nodes]
-        if len(have_hops) > 0:
-            v[3 * i + 1] = float(any(have_hops))
-            v[3 * i + 2] = float(sum(have_hops))
-            v[3 * i + 3] = float(np.mean(have_hops))
-        else:
-            v[3 * i + 1] = 0.0
-            v[3 * i + 2] = 0.0
-            v[3 * i + 3] = 0.0
-    return v
+def read_vocab_words(vocab_path): # vocab file of dataloader.create_vocab_given_counter, "word count" per line
+    with open(vocab_path, 'r', encoding = "utf8") as f:
+        return [line.split()[0] for line in f if len(line.split()) > 0]
+
+def get_vocab_node_ids(vocab_path): # sorted ids of nodes that a vocab word can be looked up as
+    words = read_vocab_words(vocab_path)
+    uris = set('/c/en/' + word.lower() for word in words) # dataloader.get_kg_vector
+    uris.update(standardized_uris('en', words))
+    uris.update('/c/en/' + word.lower() for word in lemmatise_ConceptNet_labels(words)) # lemmatised words of train_unseen
+    node_ids = np.unique(np.array([NODES_DATA.get_id(uri) for uri in uris], dtype = np.int64))
+    node_ids = node_ids[node_ids >= 0]
+    print("No. of vocab words =", len(words), ", matched nodes =", node_ids.shape[0])
+    return node_ids
+
+def get_hop_engine():
+    global HOP_ENGINE
+    if HOP_ENGINE is None:
+        HOP_ENGINE = SparseHopEngine(NODES_DATA, config.kg_vector_rel_list)
+    return HOP_ENGINE
+
+def generate_class_vectors(c, kg_vector_dir, kg_vector_prefix, vocab_node_ids = None, hop = config.kg_vector_hop): # c = Category
+    engine = get_hop_engine()
+    all_c_nodes = c.get_all_nodes()
+    all_neighbors = engine.neighbors_within(NODES_DATA.get_ids(list(all_c_nodes)), hop)
+    if vocab_node_ids is not None:
+        # only nodes that are looked up by a vocab word
+        all_neighbors = np.intersect1d(all_neighbors, vocab_node_ids, assume_unique = True)
+    print(c, len(all_neighbors))
+    
+    # Consider each partition of nodes separately
+    all_vectors = np.concatenate([engine.get_vectors_of(all_neighbors, NODES_DATA.get_ids(c.nodes[group]), hop) for group in CLASS_NODE_GROUPS], axis = 1)
+    vectors = dict(zip(NODES_DATA.get_uris(all_neighbors), all_vectors))
+
+    class_file = kg_vector_dir + kg_vector_prefix + c.label
+    with open(class_file + ".pickle", "wb") as f:
+        pickle.dump(vectors, f)
+    # the binary copies made by dataloader.convert_class_kg_vector are now stale
+    for stale_file in [class_file + ".uris.npy", class_file + ".vectors.npy"]:
+        if os.path.exists(stale_file):
+            os.remove(stale_file)
+    print('Finish calculating vectors for', c.label)
+    return c.label
+
+def generate_class_vectors_in_worker(args):
+    return generate_class_vectors(*args)
 
 
 ## Main Program
-def main_program(class_filename, node_data_filename, kg_vector_dir, kg_vector_prefix):
+def main_program(class_filename, kg_vector_dir, kg_vector_prefix, kg_vector_table_path = None, vocab_path = None, num_workers = config.prepro_num_workers, incremental = config.kg_vector_incremental):
     # - Load conceptnet
-    load_ConceptNet()
+    snapshot_dir = load_ConceptNet()
 
-    # - Load class data and form a cluster of nodes for each class
-    class_nodes = set()
+    # - Load class data, in incremental mode keep only new or changed classes
     class_info = get_class_info(class_filename)
+    manifest_path = get_kg_vector_manifest_path(kg_vector_dir, kg_vector_prefix)
+    manifest = load_kg_vector_manifest(manifest_path)
+    class_hash = {c['ConceptNet'].strip().lower(): get_class_hash(c, snapshot_dir, vocab_path) for c in class_info}
+    if incremental:
+        class_info = [c for c in class_info
+                      if manifest.get(c['ConceptNet'].strip().lower()) != class_hash[c['ConceptNet'].strip().lower()]
+                      or not os.path.exists(kg_vector_dir + kg_vector_prefix + c['ConceptNet'].strip().lower() + ".pickle")]
+        print("No. of new or changed classes =", len(class_info))
+        if len(class_info) == 0:
+            return
+    save_kg_vector_meta(kg_vector_dir, kg_vector_prefix, config.kg_vector_hop, config.kg_vector_rel_list)
+    # the (class, word) table of train_unseen is built from the class vectors
+    if kg_vector_table_path is not None and os.path.exists(kg_vector_table_path):
+        os.remove(kg_vector_table_path)
+
+    vocab_node_ids = None
+    if vocab_path is not None:
+        vocab_node_ids = get_vocab_node_ids(vocab_path)
+
+    # - Form a cluster of nodes for each class
+    class_nodes = set()
     classes = [Category(c['ConceptNet'], c['ClassDescription'], c['Hierarchy']) for c in class_info]
     for c in classes:
         class_nodes = class_nodes.union(c.get_all_nodes())
@@ -258,37 +424,32 @@ def main_program(class_filename, node_data_filename, kg_vector_dir, kg_vector_pr
     for c in classes:
         class_clusters[c.label] = c.get_all_nodes()
     print(class_clusters)
+    print("standardized_uri cache:", standardized_uri_cache_info())
 
-    # - Find neighbors of nodes in each cluster 
-
-    for c in tqdm(class_nodes):
-        print('Processing class', c)
-        NODES_DATA[c].find_neighbors(3)
-
-    pickle.dump(NODES_DATA, open(node_data_filename, "wb"))
-
+    if num_workers > 1:
+        # - Classes are independent, each worker maps the graph snapshot and writes the vectors of its classes
+        print("Calculating KG vectors with %d workers" % num_workers)
+        with multiprocessing.Pool(min(num_workers, len(classes)), initializer = load_ConceptNet_snapshot, initargs = (snapshot_dir,)) as pool:
+            for label in tqdm(pool.imap_unordered(generate_class_vectors_in_worker, [(c, kg_vector_dir, kg_vector_prefix, vocab_node_ids) for c in classes]), total = len(classes)):
+                manifest[label] = class_hash[label]
+                save_kg_vector_manifest(manifest, manifest_path)
+        return
 
     # - Calculate KG vectors for each class
 
     for c in tqdm(classes):
-        all_c_nodes = c.get_all_nodes()
-        all_neighbors = get_neighbors_of_cluster(all_c_nodes, hop = 3)
-        print(c, len(all_neighbors))
-        
-        vectors = dict()
-        for n in all_neighbors:
-            # Consider each partition of nodes separately
-            vectors[n] = np.concatenate((get_vector_of(n, c.nodes['the_class'], hop = 3), get_vector_of(n, c.nodes['super_class'], hop = 3), get_vector_of(n, c.nodes['description'], hop = 3)), axis = 0) 
-
-        pickle.dump(vectors, open(kg_vector_dir + kg_vector_prefix + c.label + ".pickle", "wb"))
-        print('Finish calculating vectors for', c.label)
+        label = generate_class_vectors(c, kg_vector_dir, kg_vector_prefix, vocab_node_ids)
+        manifest[label] = class_hash[label]
+        save_kg_vector_manifest(manifest, manifest_path)
 
 if __name__ == "__main__":
     print(config.dataset)
     if config.dataset == "dbpedia":
-        main_program(config.zhang15_dbpedia_class_label_path, config.zhang15_dbpedia_kg_vector_node_data_path, config.zhang15_dbpedia_kg_vector_dir, config.zhang15_dbpedia_kg_vector_prefix)
+        main_program(config.zhang15_dbpedia_class_label_path, config.zhang15_dbpedia_kg_vector_dir, config.zhang15_dbpedia_kg_vector_prefix, config.zhang15_dbpedia_kg_vector_table_path,
+                     config.zhang15_dbpedia_vocab_path if config.kg_vector_vocab_pruning else None)
     elif config.dataset == "20news":
-        main_program(config.news20_class_label_path, config.news20_kg_vector_node_data_path, config.news20_kg_vector_dir, config.news20_kg_vector_prefix)
+        main_program(config.news20_class_label_path, config.news20_kg_vector_dir, config.news20_kg_vector_prefix, config.news20_kg_vector_table_path,
+                     config.news20_vocab_path if config.kg_vector_vocab_pruning else None)
     else:
         raise Exception("config.dataset %s not found" % config.dataset)
     pass
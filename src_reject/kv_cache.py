@@ -0,0 +1,86 @@
+import os, pickle, sqlite3, collections
+
+
+MISSING = object()
+
+class PersistentCache():
+    # key -> value store in a sqlite table, in WAL mode so that several processes can read while
+    # another one writes; recently used entries are kept in an in-memory LRU, new entries are
+    # only written to disk by flush()
+
+    def __init__(self, filename, table, lru_size=100000):
+        self.filename = filename
+        self.table = table
+        self.lru_size = lru_size
+        self.lru = collections.OrderedDict()
+        self.pending = dict()
+        self.conn = None
+        self.pid = None
+
+    def connect(self):
+        # a connection cannot be shared with forked processes, so each process opens its own
+        if self.conn is None or self.pid != os.getpid():
+            if os.path.dirname(self.filename) != "" and not os.path.exists(os.path.dirname(self.filename)):
+                os.makedirs(os.path.dirname(self.filename))
+            self.conn = sqlite3.connect(self.filename, timeout=60)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS %s (key TEXT PRIMARY KEY, value BLOB)" % self.table)
+            self.conn.commit()
+            self.pid = os.getpid()
+        return self.conn
+
+    def remember(self, key, value):
+        self.lru[key] = value
+        self.lru.move_to_end(key)
+        while len(self.lru) > self.lru_size:
+            self.lru.popitem(last=False)
+
+    def get(self, key, default=None):
+        if key in self.lru:
+            self.lru.move_to_end(key)
+            return self.lru[key]
+        if key in self.pending:
+            return self.pending[key]
+        row = self.connect().execute("SELECT value FROM %s WHERE key = ?" % self.table, (key,)).fetchone()
+        if row is None:
+            return default
+        value = pickle.loads(row[0])
+        self.remember(key, value)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, MISSING) is not MISSING
+
+    def __getitem__(self, key):
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.pending[key] = value
+        self.remember(key, value)
+
+    def update(self, items):
+        for key, value in items:
+            self[key] = value
+
+    def flush(self):
+        # cost is proportional to the entries added since the last flush
+        if len(self.pending) == 0:
+            return 0
+        conn = self.connect()
+        conn.executemany("INSERT OR REPLACE INTO %s (key, value) VALUES (?, ?)" % self.table,
+                         [(key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)) for key, value in self.pending.items()])
+        conn.commit()
+        num_flushed = len(self.pending)
+        self.pending = dict()
+        return num_flushed
+
+    def __len__(self):
+        self.flush()
+        return self.connect().execute("SELECT COUNT(*) FROM %s" % self.table).fetchone()[0]
+
+    def is_empty(self):
+        return len(self.pending) == 0 and self.connect().execute("SELECT 1 FROM %s LIMIT 1" % self.table).fetchone() is None
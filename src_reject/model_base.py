@@ -17,6 +17,27 @@ import logging
 
 import config
 
+def global_max_pool(outputs, seq_len=None, name=None):
+    # max over the time axis of [batch, time, channel] relu outputs; with seq_len the padding positions
+    # are zeroed first, which is neutral as the outputs are non-negative
+    if seq_len is not None:
+        mask = tf.sequence_mask(seq_len, maxlen=tf.shape(outputs)[1], dtype=outputs.dtype)
+        outputs = outputs * tf.expand_dims(mask, -1)
+    return tf.reduce_max(outputs, axis=1, name=name)
+
+def get_word_embedding(vocab_size, word_embedding_dim):
+    # frozen word embedding in the graph, shared by all models of the graph; as a local variable it is
+    # neither trained nor saved in checkpoints, the controller assigns it once by feeding word_embed_init
+    word_embed_list = tf.get_collection("word_embed")
+    if len(word_embed_list) == 0:
+        word_embed_init = tf.placeholder(dtype=tf.float32, shape=[vocab_size, word_embedding_dim], name="word_embed_init")
+        word_embed = tf.Variable(word_embed_init, trainable=False, collections=[tf.GraphKeys.LOCAL_VARIABLES], name="word_embed")
+        word_embed_list = [word_embed_init, word_embed]
+        for item in word_embed_list:
+            tf.add_to_collection("word_embed", item)
+    assert word_embed_list[1].shape.as_list() == [vocab_size, word_embedding_dim]
+    return word_embed_list
+
 class Base_Model():
 
     def __init__(
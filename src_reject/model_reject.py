@@ -16,6 +16,7 @@ import numpy as np
 import logging
 
 import config
+import model_base
 
 class Model4Reject():
 
@@ -29,7 +30,8 @@ class Model4Reject():
             seen_classes,
             unseen_classes,
             word_embedding_dim=config.word_embedding_dim,
-            max_length=config.max_length
+            max_length=config.max_length,
+            vocab_size=None
     ):
         self.model_name = model_name
         self.start_learning_rate = start_learning_rate
@@ -37,6 +39,7 @@ class Model4Reject():
         self.decay_steps = decay_steps
         self.word_embedding_dim = word_embedding_dim
         self.max_length = max_length
+        self.vocab_size = vocab_size
         self.main_class = main_class
         self.seen_classes = seen_classes
         self.unseen_classes = unseen_classes
@@ -49,7 +52,17 @@ class Model4Reject():
 
     def __create_placeholders__(self):
         # the placeholder for inputs
-        self.encode_seqs = tf.placeholder(dtype=tf.float32, shape=[None, self.max_length, self.word_embedding_dim], name="encode_seqs")
+        # in bucket batching mode the time axis is cut per batch and seq_len gives the real lengths
+        time_length = None if config.bucket_batching else self.max_length
+        self.seq_len = tf.placeholder(dtype=tf.int32, shape=[None], name="seq_len") if config.bucket_batching else None
+
+        if config.embedding_in_graph:
+            # token ids are fed and looked up in the frozen embedding
+            self.word_embed_init, self.word_embed = model_base.get_word_embedding(self.vocab_size, self.word_embedding_dim)
+            self.encode_ids = tf.placeholder(dtype=tf.int32, shape=[None, time_length], name="encode_ids")
+            self.encode_seqs = tf.nn.embedding_lookup(self.word_embed, self.encode_ids, name="encode_seqs")
+        else:
+            self.encode_seqs = tf.placeholder(dtype=tf.float32, shape=[None, time_length, self.word_embedding_dim], name="encode_seqs")
         self.label_logits = tf.placeholder(dtype=tf.float32, shape=[None, 1], name="label_logits")
         
         # self.encode_seqs_anc = tf.placeholder(dtype=tf.float32, shape=[None, self.max_length, self.word_embedding_dim], name="encode_seqs_anc")
@@ -92,7 +105,7 @@ class Model4Reject():
                     act=tf.nn.relu,
                     name="cnn%d" % fsz
                 )
-                net_cnn.outputs = tf.reduce_max(net_cnn.outputs, axis=1, name="global_maxpool%d" % fsz)
+                net_cnn.outputs = model_base.global_max_pool(net_cnn.outputs, self.seq_len, name="global_maxpool%d" % fsz)
                 net_cnn_list.append(net_cnn)
 
             net_cnn = ConcatLayer(net_cnn_list, concat_dim=-1)
@@ -28,17 +28,29 @@ class Model4Seen(model_base.Base_Model):
             decay_steps,
             number_of_seen_classes,
             word_embedding_dim=config.word_embedding_dim,
-            max_length=config.max_length
+            max_length=config.max_length,
+            vocab_size=None
     ):
         self.number_of_seen_classes = number_of_seen_classes
         self.word_embedding_dim = word_embedding_dim
         self.max_length = max_length
+        self.vocab_size = vocab_size
 
         super(Model4Seen, self).__init__(model_name, start_learning_rate, decay_rate, decay_steps)
 
 
     def __create_placeholders__(self):
-        self.encode_seqs = tf.placeholder(dtype=tf.float32, shape=[config.batch_size, self.max_length, self.word_embedding_dim], name="encode_seqs")
+        # in bucket batching mode the time axis is cut per batch and seq_len gives the real lengths
+        time_length = None if config.bucket_batching else self.max_length
+        self.seq_len = tf.placeholder(dtype=tf.int32, shape=[config.batch_size, ], name="seq_len") if config.bucket_batching else None
+
+        if config.embedding_in_graph:
+            # token ids are fed and looked up in the frozen embedding
+            self.word_embed_init, self.word_embed = model_base.get_word_embedding(self.vocab_size, self.word_embedding_dim)
+            self.encode_ids = tf.placeholder(dtype=tf.int32, shape=[config.batch_size, time_length], name="encode_ids")
+            self.encode_seqs = tf.nn.embedding_lookup(self.word_embed, self.encode_ids, name="encode_seqs")
+        else:
+            self.encode_seqs = tf.placeholder(dtype=tf.float32, shape=[config.batch_size, time_length, self.word_embedding_dim], name="encode_seqs")
         self.category_target_index = tf.placeholder(dtype=tf.int32, shape=[config.batch_size, ], name="category_target_index")
 
     def __create_model__(self):
@@ -77,7 +89,7 @@ class Model4Seen(model_base.Base_Model):
                     act=tf.nn.relu,
                     name="cnn%d" % fsz
                 )
-                net_cnn.outputs = tf.reduce_max(net_cnn.outputs, axis=1, name="global_maxpool%d" % fsz)
+                net_cnn.outputs = model_base.global_max_pool(net_cnn.outputs, self.seq_len, name="global_maxpool%d" % fsz)
                 net_cnn_list.append(net_cnn)
 
             net_cnn = ConcatLayer(net_cnn_list, concat_dim=-1)
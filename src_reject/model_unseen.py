@@ -40,13 +40,33 @@ class Model4Unseen(model_base.Base_Model):
         super(Model4Unseen, self).__init__(model_name, start_learning_rate, decay_rate, decay_steps)
 
     def __create_placeholders__(self):
+        # in bucket batching mode the time axis is cut per batch and seq_len gives the real lengths
+        if config.bucket_batching:
+            assert config.model not in ["rnnfc", "autoencoder"], "bucket batching is not supported by %s" % config.model
+        if config.embedding_in_graph:
+            assert config.model != "autoencoder", "embedding in graph is not supported by %s" % config.model
+        time_length = None if config.bucket_batching else self.max_length
+        self.seq_len = tf.placeholder(dtype=tf.int32, shape=[config.batch_size], name="seq_len") if config.bucket_batching else None
+
         self.target_seqs = tf.placeholder(dtype=tf.int32, shape=[config.batch_size, self.max_length], name="target_seqs")
         self.target_mask = tf.placeholder(dtype=tf.int32, shape=[config.batch_size, self.max_length], name="target_mask")
         self.decode_seqs = tf.placeholder(dtype=tf.float32, shape=[config.batch_size, self.max_length, self.word_embedding_dim], name="decode_seqs")
 
-        self.encode_seqs = tf.placeholder(dtype=tf.float32, shape=[config.batch_size, self.max_length, self.word_embedding_dim], name="encode_seqs")
-        self.class_label_seqs = tf.placeholder(dtype=tf.float32, shape=[config.batch_size, self.max_length, self.word_embedding_dim], name="class_label_seqs")
-        self.kg_vector = tf.placeholder(dtype=tf.float32, shape=[config.batch_size, self.max_length, self.kg_embedding_dim], name="kg_score")
+        if config.embedding_in_graph:
+            # token ids and class label word ids are fed and looked up in the frozen embedding
+            self.word_embed_init, self.word_embed = model_base.get_word_embedding(self.vocab_size, self.word_embedding_dim)
+            self.encode_ids = tf.placeholder(dtype=tf.int32, shape=[config.batch_size, time_length], name="encode_ids")
+            self.class_label_ids = tf.placeholder(dtype=tf.int32, shape=[config.batch_size], name="class_label_ids")
+            self.encode_seqs = tf.nn.embedding_lookup(self.word_embed, self.encode_ids, name="encode_seqs")
+            self.class_label_seqs = tf.tile(
+                tf.expand_dims(tf.nn.embedding_lookup(self.word_embed, self.class_label_ids), 1),
+                [1, time_length if time_length is not None else tf.shape(self.encode_ids)[1], 1],
+                name="class_label_seqs"
+            )
+        else:
+            self.encode_seqs = tf.placeholder(dtype=tf.float32, shape=[config.batch_size, time_length, self.word_embedding_dim], name="encode_seqs")
+            self.class_label_seqs = tf.placeholder(dtype=tf.float32, shape=[config.batch_size, time_length, self.word_embedding_dim], name="class_label_seqs")
+        self.kg_vector = tf.placeholder(dtype=tf.float32, shape=[config.batch_size, time_length, self.kg_embedding_dim], name="kg_score")
         self.category_logits = tf.placeholder(dtype=tf.float32, shape=[config.batch_size, 1], name="category_logits")
 
         # self.class_label_single = tf.placeholder(dtype=tf.float32, shape=[config.batch_size, self.word_embedding_dim], name="class_label_single")
@@ -107,7 +127,7 @@ class Model4Unseen(model_base.Base_Model):
 
             net_kg = ReshapeLayer(
                 net_kg,
-                shape=(-1, self.max_length, self.kg_embedding_dim),
+                shape=(config.batch_size, -1, self.kg_embedding_dim) if config.bucket_batching else (-1, self.max_length, self.kg_embedding_dim),
                 name="reshape_kg_2"
             )
 
@@ -162,7 +182,7 @@ class Model4Unseen(model_base.Base_Model):
                     act=tf.nn.relu,
                     name="cnn%d" % fsz
                 )
-                net_cnn.outputs = tf.reduce_max(net_cnn.outputs, axis=1, name="global_maxpool%d" % fsz)
+                net_cnn.outputs = model_base.global_max_pool(net_cnn.outputs, self.seq_len, name="global_maxpool%d" % fsz)
                 net_cnn_list.append(net_cnn)
 
             '''
@@ -260,7 +280,7 @@ class Model4Unseen(model_base.Base_Model):
                     act=tf.nn.relu,
                     name="cnn%d" % fsz
                 )
-                net_cnn.outputs = tf.reduce_max(net_cnn.outputs, axis=1, name="global_maxpool%d" % fsz)
+                net_cnn.outputs = model_base.global_max_pool(net_cnn.outputs, self.seq_len, name="global_maxpool%d" % fsz)
                 net_cnn_list.append(net_cnn)
 
             net_cnn = ConcatLayer(net_cnn_list + [net_class_label_embed], concat_dim=-1)
@@ -0,0 +1,6 @@
+import os, sys
+
+# the modules are imported as top-level modules from src_reject, as the scripts do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# config parses the command line at import, it must not see the arguments of pytest
+sys.argv = sys.argv[:1]
@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+
+from conceptnet_graph import SparseHopEngine, sort_uris, build_graph, save_graph, load_graph
+
+RELATION_NAMES = ["/r/RelatedTo", "/r/IsA", "/r/PartOf", "/r/Synonym"]
+
+
+def random_edges(num_nodes=60, num_edges=150, seed=0):
+    rng = np.random.RandomState(seed)
+    sub_ids = rng.randint(0, num_nodes - 5, num_edges) # the last nodes have no edge
+    obj_ids = rng.randint(0, num_nodes - 5, num_edges)
+    rel_ids = rng.randint(0, len(RELATION_NAMES), num_edges).astype(np.uint8)
+    keep = sub_ids != obj_ids
+    return sub_ids[keep], obj_ids[keep], rel_ids[keep]
+
+def make_graph(num_nodes=60, seed=0):
+    uris = sort_uris(["/c/en/node%d" % i for i in range(num_nodes)])
+    sub_ids, obj_ids, rel_ids = random_edges(num_nodes, seed=seed)
+    return build_graph(uris, sub_ids, obj_ids, rel_ids, RELATION_NAMES), (sub_ids, obj_ids, rel_ids)
+
+def set_neighbors(edges, num_nodes, rel_list=None):
+    # adjacency as sets, as the graph was kept before the CSR layout
+    neighbors = [set() for i in range(num_nodes)]
+    for sub_id, obj_id, rel_id in zip(*edges):
+        if rel_list is None or RELATION_NAMES[rel_id] in rel_list:
+            neighbors[sub_id].add(obj_id)
+            neighbors[obj_id].add(sub_id)
+    return neighbors
+
+def set_layers(neighbors, source_ids, hop):
+    # layers[h] = nodes at hop distance h of source_ids, expanded one set at a time
+    layers = [set(source_ids)]
+    visited = set(source_ids)
+    for h in range(hop):
+        layer = set()
+        for node_id in layers[-1]:
+            layer |= neighbors[node_id]
+        layer -= visited
+        visited |= layer
+        layers.append(layer)
+    return layers
+
+def set_vector_of(neighbors, node_id, source_ids, hop):
+    # one KG vector group: [in cluster, (any, sum, mean) for each hop]
+    v = np.zeros(3 * hop + 1)
+    v[0] = float(node_id in source_ids)
+    layers = [set_layers(neighbors, [source_id], hop) for source_id in source_ids]
+    for i in range(hop):
+        have_hops = [node_id in source_layers[i + 1] for source_layers in layers]
+        if len(have_hops) > 0:
+            v[3 * i + 1] = float(any(have_hops))
+            v[3 * i + 2] = float(sum(have_hops))
+            v[3 * i + 3] = float(np.mean(have_hops))
+    return v
+
+
+def test_build_graph_is_undirected_and_deduplicated():
+    graph, edges = make_graph()
+    neighbors = set_neighbors(edges, len(graph))
+    for node_id in range(len(graph)):
+        row = graph.indices[graph.indptr[node_id]:graph.indptr[node_id + 1]]
+        assert list(row) == sorted(neighbors[node_id])
+    assert graph.num_edges() == sum(len(n) for n in neighbors) // 2
+
+def test_build_graph_merges_relations():
+    uris = sort_uris(["/c/en/a", "/c/en/b", "/c/en/c"])
+    graph = build_graph(uris, np.array([0, 1, 0]), np.array([1, 0, 2]), np.array([0, 2, 1], dtype=np.uint8), RELATION_NAMES)
+    assert graph.num_edges() == 2
+    assert list(graph.relations[graph.indptr[0]:graph.indptr[1]]) == [0b101, 0b010]
+    assert list(graph.relations[graph.indptr[1]:graph.indptr[2]]) == [0b101]
+
+def test_get_id():
+    graph, edges = make_graph()
+    assert graph.get_id("/c/en/node7") >= 0
+    assert graph.get_uri(graph.get_id("/c/en/node7")) == "/c/en/node7"
+    assert graph.get_id("/c/en/missing") == -1
+    assert "/c/en/node7" in graph and "/c/en/missing" not in graph
+    node_ids = graph.get_ids(["/c/en/node3", "/c/en/node11"])
+    assert graph.get_uris(node_ids) == ["/c/en/node3", "/c/en/node11"]
+
+def test_save_load_graph(tmp_path):
+    graph, edges = make_graph()
+    graph_dir = str(tmp_path) + "/"
+    save_graph(graph, graph_dir)
+    loaded = load_graph(graph_dir)
+    assert isinstance(loaded.indices, np.memmap)
+    assert np.array_equal(loaded.uris, graph.uris)
+    assert np.array_equal(loaded.indptr, graph.indptr)
+    assert np.array_equal(loaded.indices, graph.indices)
+    assert np.array_equal(loaded.relations, graph.relations)
+    assert loaded.relation_names == RELATION_NAMES
+
+@pytest.mark.parametrize("rel_list", [None, ["/r/IsA", "/r/Synonym"], ["/r/PartOf"]])
+@pytest.mark.parametrize("hop", [0, 1, 2, 4])
+def test_neighbors_within_matches_set_expansion(rel_list, hop):
+    graph, edges = make_graph()
+    neighbors = set_neighbors(edges, len(graph), rel_list)
+    engine = SparseHopEngine(graph, rel_list)
+    for source_ids in [[0], [3, 17, 40], [len(graph) - 1]]:
+        expected = set().union(*set_layers(neighbors, source_ids, hop))
+        assert list(engine.neighbors_within(source_ids, hop)) == sorted(expected)
+
+@pytest.mark.parametrize("rel_list", [None, ["/r/RelatedTo", "/r/PartOf"]])
+@pytest.mark.parametrize("hop", [1, 3, 5])
+def test_hop_vectors_match_set_expansion(rel_list, hop):
+    graph, edges = make_graph(seed=1)
+    neighbors = set_neighbors(edges, len(graph), rel_list)
+    engine = SparseHopEngine(graph, rel_list)
+    for source_ids in [[5], [2, 9, 30, 31], []]:
+        node_ids = engine.neighbors_within([2, 5, 9], hop)
+        vectors = engine.get_vectors_of(node_ids, np.array(source_ids, dtype=np.int64), hop)
+        expected = np.array([set_vector_of(neighbors, node_id, source_ids, hop) for node_id in node_ids])
+        assert vectors.shape == (node_ids.shape[0], 3 * hop + 1)
+        assert np.array_equal(vectors, expected)
+
+def test_unknown_relation():
+    graph, edges = make_graph()
+    with pytest.raises(AssertionError):
+        SparseHopEngine(graph, ["/r/NotARelation"])
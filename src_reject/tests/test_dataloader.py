@@ -0,0 +1,154 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+pytest.importorskip("tensorflow")
+pytest.importorskip("tensorlayer")
+import config
+import dataloader
+
+TEXT_SEQS = [[3, 1, 4], [], [1, 5, 9, 2, 6], [5], [3, 5]]
+
+
+def test_ragged_seqs_round_trip(tmp_path):
+    processed_file = str(tmp_path / "train.npy")
+    dataloader.save_processed_text(TEXT_SEQS, processed_file)
+    text_seqs = dataloader.load_processed_text(processed_file)
+    assert isinstance(text_seqs, dataloader.RaggedSeqs)
+    assert isinstance(text_seqs.tokens, np.memmap)
+    assert len(text_seqs) == len(TEXT_SEQS)
+    assert [list(text) for text in text_seqs] == TEXT_SEQS
+    assert list(text_seqs.lengths()) == [len(text) for text in TEXT_SEQS]
+    assert list(text_seqs[-1]) == TEXT_SEQS[-1]
+    with pytest.raises(IndexError):
+        text_seqs[len(TEXT_SEQS)]
+    assert sorted(os.listdir(str(tmp_path))) == ["train.npy", "train_offsets.npy"]
+
+def test_ragged_seqs_selection(tmp_path):
+    processed_file = str(tmp_path / "train.npy")
+    dataloader.save_ragged_seqs(TEXT_SEQS, processed_file)
+    text_seqs = dataloader.load_ragged_seqs(processed_file)
+    idx_list = [4, 0, 2, 0]
+    selected = dataloader.select_text_seqs(text_seqs, idx_list)
+    assert [list(text) for text in selected] == [TEXT_SEQS[idx] for idx in idx_list]
+    assert list(selected.lengths()) == [len(TEXT_SEQS[idx]) for idx in idx_list]
+    # a selection of a selection maps back to the stored documents
+    assert [list(text) for text in selected.take([1, 2])] == [TEXT_SEQS[0], TEXT_SEQS[2]]
+    assert [list(text) for text in text_seqs[1:4]] == TEXT_SEQS[1:4]
+    assert dataloader.select_text_seqs(TEXT_SEQS, idx_list) == [TEXT_SEQS[idx] for idx in idx_list]
+
+def test_ragged_seqs_concatenation(tmp_path):
+    processed_file = str(tmp_path / "train.npy")
+    dataloader.save_ragged_seqs(TEXT_SEQS, processed_file)
+    text_seqs = dataloader.load_ragged_seqs(processed_file)
+    selected = text_seqs.take([4, 1, 2])
+    aug_text_seqs = [[7, 7], [], [8]]
+    for combined, expected in [(text_seqs + aug_text_seqs, TEXT_SEQS + aug_text_seqs),
+                               (aug_text_seqs + selected, aug_text_seqs + [TEXT_SEQS[4], TEXT_SEQS[1], TEXT_SEQS[2]]),
+                               (selected + text_seqs, [TEXT_SEQS[4], TEXT_SEQS[1], TEXT_SEQS[2]] + TEXT_SEQS)]:
+        assert isinstance(combined, dataloader.RaggedSeqs)
+        assert [list(text) for text in combined] == expected
+        assert list(combined.lengths()) == [len(text) for text in expected]
+    assert text_seqs + [] is text_seqs
+    assert [] + selected is selected
+
+def test_pickled_text_is_unchanged(tmp_path):
+    processed_file = str(tmp_path / "train.pkl")
+    dataloader.save_processed_text(TEXT_SEQS, processed_file)
+    assert dataloader.load_processed_text(processed_file) == TEXT_SEQS
+
+TEXTS = ["The quick brown fox, jumps over the lazy dog.", "", "A dog_s life: 3 dogs & 2 foxes!",
+         "the the the fox", "Caf\xe9 au lait", "over and over again"]
+
+def preprocess_serial(texts, vocab=None):
+    try:
+        return dataloader.preprocess(list(texts), vocab, num_workers=1)
+    except LookupError:
+        pytest.skip("NLTK tokenizer data not found")
+
+def test_parallel_preprocess_matches_serial(tmp_path):
+    serial = preprocess_serial(TEXTS)
+    assert dataloader.preprocess(list(TEXTS), num_workers=2, chunk_size=2) == serial
+
+    vocab = dataloader.create_vocab_given_text(serial, str(tmp_path / "vocab.txt"), min_word_count=1)
+    serial_ids = preprocess_serial(TEXTS, vocab)
+    assert dataloader.preprocess(list(TEXTS), vocab, num_workers=2, chunk_size=2) == serial_ids
+    assert dataloader.sentence_word_to_id([list(text) for text in serial], vocab, num_workers=2, chunk_size=4) == serial_ids
+
+@pytest.mark.parametrize("num_workers", [1, 2])
+def test_streamed_vocab_matches_create_vocab(tmp_path, num_workers):
+    import pandas as pd
+    import tensorlayer as tl
+    csv_file = str(tmp_path / "full.csv")
+    # an empty text would be read back as NaN
+    texts = [text for text in TEXTS if len(text) > 0] * 3
+    pd.DataFrame({"text": texts}).to_csv(csv_file)
+    expected_file = str(tmp_path / "expected_vocab.txt")
+    tl.nlp.create_vocab(preprocess_serial(texts), word_counts_output_file=expected_file, min_word_count=2)
+
+    vocab_file = str(tmp_path / "vocab.txt")
+    word_counter = dataloader.count_words_from_csv(csv_file, "text", num_workers=num_workers, chunk_size=4)
+    dataloader.create_vocab_given_counter(word_counter, vocab_file, min_word_count=2)
+    with open(expected_file) as f_expected, open(vocab_file) as f:
+        assert f.read() == f_expected.read()
+
+def load_glove_word_vector_per_line(filename, vocab):
+    # the line by line parse that the GloVe store replaces
+    glove_mat = np.zeros((vocab.unk_id + 1, config.word_embedding_dim))
+    with open(filename, 'r') as f:
+        for line in f:
+            content = line.replace("\n", "").split(" ")
+            word_id = vocab.word_to_id(content[0])
+            if word_id != vocab.unk_id:
+                glove_mat[word_id, :] = np.array(content[1:]).astype(np.float32)
+    return glove_mat
+
+def test_glove_store_matches_per_line_parse(tmp_path):
+    import collections
+    vocab = dataloader.create_vocab_given_counter(collections.Counter({"fox": 3, "dog": 2, "lazy": 2, "cat": 1}), str(tmp_path / "vocab.txt"), min_word_count=1)
+    rng = np.random.RandomState(0)
+    # "dog" is listed twice, the later vector wins
+    glove_words = ["the", "dog", "fox", "unseen", "dog", "cat", "<PAD>"]
+    glove_file = str(tmp_path / "glove.txt")
+    with open(glove_file, "w") as f:
+        f.write("\n".join([" ".join([word] + ["%.6f" % value for value in rng.randn(config.word_embedding_dim)]) for word in glove_words]) + "\n")
+
+    glove_mat = dataloader.load_glove_word_vector(glove_file, str(tmp_path / "glove_mat.npz"), vocab, force_process=True)
+    np.testing.assert_array_equal(glove_mat, load_glove_word_vector_per_line(glove_file, vocab))
+    # the converted store is reused by the next call
+    assert os.path.exists(dataloader.get_glove_store_paths(glove_file)[0])
+    np.testing.assert_array_equal(dataloader.load_glove_word_vector(glove_file, str(tmp_path / "glove_mat2.npz"), vocab, force_process=True), glove_mat)
+
+def test_class_kg_vectors_match_pickled_dict(tmp_path):
+    rng = np.random.RandomState(0)
+    class_kg_dict = {uri: rng.rand(config.kg_embedding_dim) for uri in ["/c/en/dog", "/c/en/caf\xe9", "/c/en/cat", "/c/en/a"]}
+    class_file = str(tmp_path / "Animal")
+    with open(class_file + ".pickle", "wb") as f:
+        pickle.dump(class_kg_dict, f)
+    class_kg_vectors = dataloader.ClassKGVectors(class_file)
+    assert len(class_kg_vectors) == len(class_kg_dict)
+    for uri, vector in class_kg_dict.items():
+        np.testing.assert_array_equal(class_kg_vectors[uri], vector)
+    assert "/c/en/bird" not in class_kg_vectors
+    assert sorted(os.listdir(str(tmp_path))) == ["Animal.pickle", "Animal.uris.npy", "Animal.vectors.npy"]
+
+def test_kg_vector_table_matches_get_kg_vector(tmp_path):
+    import collections
+    vocab = dataloader.create_vocab_given_counter(collections.Counter({"fox": 3, "dog": 2, "Lazy": 2, "cat": 1}), str(tmp_path / "vocab.txt"), min_word_count=1)
+    rng = np.random.RandomState(0)
+    kg_vector_dict = {
+        "/c/en/animal": {"/c/en/fox": rng.rand(config.kg_embedding_dim), "dog": rng.rand(config.kg_embedding_dim), "/c/en/lazy": rng.rand(config.kg_embedding_dim)},
+        "/c/en/plant": {"/c/en/cat": rng.rand(config.kg_embedding_dim)},
+    }
+    class_dict = {2: "plant", 1: "animal"}
+    table_file = str(tmp_path / "kg_vector_table.npy")
+    kg_vector_table = dataloader.load_kg_vector_table(kg_vector_dict, class_dict, vocab, table_file, force_process=True)
+
+    text = [vocab.word_to_id(word) for word in ["dog", "the", "fox", "Lazy", "cat", "fox"]]
+    for class_idx, class_id in enumerate(sorted(class_dict)):
+        expected = np.array([dataloader.get_kg_vector(kg_vector_dict, class_dict[class_id], vocab.id_to_word(word_id)) for word_id in text], dtype=np.float32)
+        np.testing.assert_array_equal(kg_vector_table[class_idx, text], expected)
+    # the saved table is reused
+    np.testing.assert_array_equal(dataloader.load_kg_vector_table(kg_vector_dict, class_dict, vocab, table_file), kg_vector_table)
@@ -0,0 +1,113 @@
+import csv
+import gzip
+import json
+
+import numpy as np
+import pytest
+
+pytest.importorskip("nltk")
+pytest.importorskip("sklearn")
+pytest.importorskip("wordfreq")
+try:
+    import kg_vector_generation
+except LookupError:
+    # the NLTK stopwords are loaded at import
+    pytest.skip("NLTK data not found", allow_module_level=True)
+
+REL_LIST = ['/r/IsA', '/r/PartOf', '/r/AtLocation', '/r/RelatedTo']
+
+ASSERTIONS = [
+    ("/r/IsA", "/c/en/dog/n", "/c/en/animal", {"dataset": "/d/wordnet", "weight": 2.0}),
+    ("/r/RelatedTo", "/c/en/dogs", "/c/en/cat", {"dataset": "/d/verbosity", "weight": 0.5}),
+    ("/r/RelatedTo", "/c/en/dog", "/c/fr/chien", {"weight": 1.0}),
+    ("/r/Synonym", "/c/en/hound", "/c/en/dog", {"weight": 3.0}),
+    ("/r/AtLocation", "/c/en/cat/n", "/c/en/house", {"weight": 1.0, "surfaceText": "[[cat]] \"weight\": 0.1 in [[house]]"}),
+    ("/r/PartOf", "/c/en/tail", "/c/en/dog/n", {"sources": [{"weight": 0.1}], "weight": 1.5}),
+    ("/r/IsA", "/c/fr/chat", "/c/fr/animal", {"weight": 2.0}),
+    ("/r/RelatedTo", "/c/en/animal", "/c/en/dogs", {"weight": 1.0}),
+]
+
+
+def write_assertions(filename):
+    opener = gzip.open if filename.endswith('.gz') else open
+    with opener(filename, 'wt', encoding="utf8") as f:
+        for rel, sub, obj, details in ASSERTIONS:
+            f.write("\t".join(["/a/[%s/,%s/,%s/]" % (rel, sub, obj), rel, sub, obj, json.dumps(details)]) + "\n")
+
+def read_ConceptNet_two_passes(filename, rel_list):
+    # the separate node and edge passes of csv.reader and json.loads that read_ConceptNet replaces
+    nodes = set()
+    edges = []
+    with open(filename, 'r', encoding="utf8") as csvfile:
+        for line in csv.reader(csvfile, delimiter='\t'):
+            if not line[2].startswith('/c/en/') or not line[3].startswith('/c/en/'):
+                continue
+            nodes.add(kg_vector_generation.remove_word_sense(line[2]))
+            nodes.add(kg_vector_generation.remove_word_sense(line[3]))
+    with open(filename, 'r', encoding="utf8") as csvfile:
+        for line in csv.reader(csvfile, delimiter='\t'):
+            if line[1].strip() in rel_list:
+                if json.loads(line[4])['weight'] < 1.0:
+                    continue
+                if not line[2].startswith('/c/en/') or not line[3].startswith('/c/en/'):
+                    continue
+                edges.append((kg_vector_generation.remove_word_sense(line[2]), kg_vector_generation.remove_word_sense(line[3]), line[1].strip()))
+    return nodes, edges
+
+
+def test_get_edge_weight_matches_json():
+    for rel, sub, obj, details in ASSERTIONS:
+        assert kg_vector_generation.get_edge_weight(json.dumps(details)) == details["weight"]
+    assert kg_vector_generation.get_edge_weight('{"weight":2}') == 2.0
+    assert kg_vector_generation.get_edge_weight('{"weight": 1.0, "dataset": "/d/conceptnet"}') == 1.0
+
+@pytest.mark.parametrize("suffix", [".csv", ".csv.gz"])
+def test_read_ConceptNet_matches_two_passes(tmp_path, suffix):
+    filename = str(tmp_path / ("assertions" + suffix))
+    write_assertions(filename)
+    reference_file = str(tmp_path / "reference.csv")
+    write_assertions(reference_file)
+    expected_nodes, expected_edges = read_ConceptNet_two_passes(reference_file, REL_LIST)
+
+    nodes, sub_ids, obj_ids, rel_ids, relation_names = kg_vector_generation.read_ConceptNet(filename, REL_LIST, 1.0)
+    assert set(nodes) == expected_nodes
+    assert sorted(nodes.values()) == list(range(len(nodes)))
+    uris = sorted(nodes, key=nodes.get)
+    assert [(uris[sub], uris[obj], relation_names[rel]) for sub, obj, rel in zip(sub_ids, obj_ids, rel_ids)] == expected_edges
+
+LABELS = ["dogs", "running", "ice_cream", "better", "cats", "quickly", "went", "dogs", "geese"]
+
+def lemmatise_labels_one_by_one(labels):
+    try:
+        return [kg_vector_generation.lemmatise_ConceptNet_label(label) for label in labels]
+    except LookupError:
+        pytest.skip("NLTK tagger or WordNet data not found")
+
+def test_batched_lemmatisation_matches_per_label():
+    expected = lemmatise_labels_one_by_one(LABELS)
+    assert kg_vector_generation.lemmatise_ConceptNet_labels(LABELS) == expected
+
+@pytest.mark.parametrize("num_workers", [1, 2])
+def test_lemmatised_dict_matches_per_uri(tmp_path, monkeypatch, num_workers):
+    lemmatise_labels_one_by_one(LABELS[:1])
+    monkeypatch.setattr(kg_vector_generation.config, "conceptnet_lemma_cache_path", str(tmp_path / "lemma_cache.tsv"))
+    nodes = ["/c/en/" + label for label in LABELS] + ["/c/en/dogs/n"]
+    expected = {n: kg_vector_generation.lemmatise_ConceptNet_uri(n) for n in nodes}
+    assert kg_vector_generation.create_lemmatised_dict(nodes, num_workers=num_workers, chunk_size=3) == expected
+    # the second run reads every label from the cache
+    assert len(kg_vector_generation.load_lemma_cache(str(tmp_path / "lemma_cache.tsv"))) == len(set(LABELS))
+    assert kg_vector_generation.create_lemmatised_dict(nodes[::-1], num_workers=num_workers, chunk_size=3) == expected
+
+def test_lemma_cache_skips_broken_lines(tmp_path, monkeypatch):
+    lemmatise_labels_one_by_one(LABELS[:1])
+    cache_path = str(tmp_path / "lemma_cache.tsv")
+    monkeypatch.setattr(kg_vector_generation.config, "conceptnet_lemma_cache_path", cache_path)
+    with open(cache_path, "w", encoding="utf8") as f:
+        f.write("cats\t/c/en/cat\nbad\tline\twith three fields\nnotab\ngeese\t/c/en/go")
+    assert kg_vector_generation.load_lemma_cache(cache_path) == {"cats": "/c/en/cat"}
+
+    nodes = ["/c/en/cats", "/c/en/geese"]
+    expected = {n: kg_vector_generation.lemmatise_ConceptNet_uri(n) for n in nodes}
+    assert kg_vector_generation.create_lemmatised_dict(nodes, num_workers=1) == expected
+    # the relemmatised label is not joined to the half-written line
+    assert kg_vector_generation.load_lemma_cache(cache_path) == {"cats": "/c/en/cat", "geese": expected["/c/en/geese"]}
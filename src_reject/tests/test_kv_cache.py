@@ -0,0 +1,58 @@
+import multiprocessing
+
+import kv_cache
+
+
+def write_entries(args):
+    filename, worker, keys = args
+    cache = kv_cache.PersistentCache(filename, "test")
+    for key in keys:
+        cache[key] = (worker, key)
+    cache["shared"] = worker
+    return cache.flush()
+
+
+def test_get_set_flush(tmp_path):
+    filename = str(tmp_path / "cache.sqlite")
+    cache = kv_cache.PersistentCache(filename, "test", lru_size=2)
+    assert cache.is_empty()
+    cache["a"] = [1, 2]
+    cache.update([("b", None), ("c", {"x": 1})])
+    assert cache["a"] == [1, 2]
+    assert "b" in cache and cache.get("b", kv_cache.MISSING) is None
+    assert "d" not in cache
+    # nothing is on disk before flush
+    assert kv_cache.PersistentCache(filename, "test").is_empty()
+    assert cache.flush() == 3
+    assert cache.flush() == 0
+
+    reopened = kv_cache.PersistentCache(filename, "test")
+    assert len(reopened) == 3
+    assert reopened["c"] == {"x": 1}
+    assert reopened.get("d", "default") == "default"
+
+def test_tables_are_separate(tmp_path):
+    filename = str(tmp_path / "cache.sqlite")
+    first = kv_cache.PersistentCache(filename, "first")
+    first["a"] = 1
+    first.flush()
+    second = kv_cache.PersistentCache(filename, "second")
+    assert "a" not in second
+    assert len(first) == 1 and len(second) == 0
+
+def test_concurrent_writers(tmp_path):
+    filename = str(tmp_path / "cache.sqlite")
+    cache = kv_cache.PersistentCache(filename, "test")
+    cache["parent"] = "before fork"
+    cache.flush()
+    num_workers = 4
+    tasks = [(filename, worker, ["%d-%d" % (worker, idx) for idx in range(500)]) for worker in range(num_workers)]
+    with multiprocessing.Pool(num_workers) as pool:
+        assert pool.map(write_entries, tasks) == [501] * num_workers
+
+    # the connection of the parent is still usable and sees every worker's entries
+    assert len(cache) == 1 + num_workers * 500 + 1
+    for worker in range(num_workers):
+        assert cache["%d-%d" % (worker, 499)] == (worker, "%d-%d" % (worker, 499))
+    assert cache["shared"] in range(num_workers)
+    assert cache["parent"] == "before fork"
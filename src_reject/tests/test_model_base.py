@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+tf = pytest.importorskip("tensorflow")
+pytest.importorskip("tensorlayer")
+import model_base
+
+
+def test_global_max_pool_ignores_padding():
+    rng = np.random.RandomState(0)
+    outputs = np.maximum(rng.randn(4, 7, 3), 0).astype(np.float32)
+    seq_len = np.array([7, 3, 1, 5], dtype=np.int32)
+    # padding positions hold large values that must not reach the max
+    for idx, length in enumerate(seq_len):
+        outputs[idx, length:, :] = 100.0
+    expected = np.array([outputs[idx, :length, :].max(axis=0) for idx, length in enumerate(seq_len)])
+
+    with tf.Graph().as_default():
+        outputs_ph = tf.placeholder(tf.float32, [None, None, 3])
+        seq_len_ph = tf.placeholder(tf.int32, [None])
+        pooled = model_base.global_max_pool(outputs_ph, seq_len_ph)
+        unmasked = model_base.global_max_pool(outputs_ph)
+        with tf.Session() as sess:
+            pooled_value, unmasked_value = sess.run([pooled, unmasked], feed_dict={outputs_ph: outputs, seq_len_ph: seq_len})
+
+    assert np.allclose(pooled_value, expected)
+    assert np.allclose(unmasked_value, outputs.max(axis=1))
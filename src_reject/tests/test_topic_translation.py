@@ -0,0 +1,54 @@
+import csv
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("gensim")
+pytest.importorskip("nltk")
+pytest.importorskip("tensorflow")
+pytest.importorskip("tensorlayer")
+import config
+import dataloader
+# topic_translation loads the GloVe store at import
+if not os.path.exists(config.word_embed_file_path) and not os.path.exists(dataloader.get_glove_store_paths(config.word_embed_file_path)[0]):
+    pytest.skip("GloVe file not found", allow_module_level=True)
+import topic_translation
+from gensim.models import KeyedVectors
+
+
+def test_analogy_engine_matches_most_similar_cosmul():
+    rng = np.random.RandomState(0)
+    words = ["word%d" % idx for idx in range(300)]
+    vectors = rng.randn(len(words), 20).astype(np.float32)
+    kv = KeyedVectors(vectors.shape[1])
+    kv.add_vectors(words, vectors)
+    engine = topic_translation.AnalogyEngine(vectors, words, dict(zip(words, range(len(words)))), batch_size=7)
+
+    queries = words[10:40]
+    translated = engine.translate(queries, "word1", "word2", topn=10)
+    for word, candidates in zip(queries, translated):
+        expected = kv.most_similar_cosmul(positive=["word2", word], negative=["word1"], topn=10)
+        assert candidates == [candidate for candidate, _ in expected]
+
+def write_shard(shard_path, rows):
+    with open(shard_path, 'w', encoding="latin-1", newline='') as csvwritefile:
+        writer = csv.DictWriter(csvwritefile, fieldnames=topic_translation.AUGMENT_FIELDNAMES)
+        writer.writeheader()
+        for idx, (from_class, to_class, text) in enumerate(rows):
+            writer.writerow({'No.': idx, 'from_class': from_class, 'to_class': to_class, 'text': text})
+
+def test_merge_augment_shards(tmp_path):
+    shards = [[(1, 2, "first, text"), (1, 3, "second")], [], [(2, 1, "caf\xe9 \"quoted\"\nline")]]
+    shard_paths = [str(tmp_path / ("train_augmented.csv.shard%d" % idx)) for idx in range(len(shards))]
+    for shard_path, rows in zip(shard_paths, shards):
+        write_shard(shard_path, rows)
+    train_augmented_path = str(tmp_path / "train_augmented.csv")
+    topic_translation.merge_augment_shards(shard_paths, train_augmented_path)
+
+    with open(train_augmented_path, encoding="latin-1") as csvfile:
+        merged = list(csv.DictReader(csvfile))
+    # shard order is kept and No. runs over all the shards
+    assert [row['No.'] for row in merged] == ["0", "1", "2"]
+    assert [(int(row['from_class']), int(row['to_class']), row['text']) for row in merged] == sum(shards, [])
+    assert not any(os.path.exists(shard_path) for shard_path in shard_paths)
@@ -16,6 +16,7 @@ Example:
 """
 import wordfreq
 import re
+from functools import lru_cache
 
 
 # English-specific stopword handling
@@ -24,7 +25,11 @@ DROP_FIRST = ['to']
 DOUBLE_DIGIT_RE = re.compile(r'[0-9][0-9]')
 DIGIT_RE = re.compile(r'[0-9]')
 
+# Labels and vocabulary words recur a lot, so standardized URIs are memoized
+STANDARDIZED_URI_CACHE_SIZE = 2 ** 20
 
+
+@lru_cache(maxsize=STANDARDIZED_URI_CACHE_SIZE)
 def standardized_uri(language, term):
     """
     Get a URI that is suitable to label a row of a vector space, by making sure
@@ -42,6 +47,25 @@ def standardized_uri(language, term):
     return replace_numbers(term)
 
 
+def standardized_uris(language, terms):
+    """
+    Standardize a whole vocabulary at once: the result is a list in which
+    position i holds the URI of terms[i], so a vocabulary id indexes it
+    directly and later lookups never need to tokenize again.
+
+    >>> standardized_uris('en', ['a test phrase', 'apples'])
+    ['/c/en/test_phrase', '/c/en/apples']
+    """
+    return [standardized_uri(language, term) for term in terms]
+
+
+def standardized_uri_cache_info():
+    """
+    Hits, misses and size of the standardized_uri cache.
+    """
+    return standardized_uri.cache_info()
+
+
 def english_filter(tokens):
     """
     Given a list of tokens, remove a small list of English stopwords. This
@@ -1,14 +1,12 @@
-import pickle, json, requests, csv, copy, os, re, sys, math, random
+import pickle, json, requests, csv, copy, os, re, sys, math, random, hashlib, multiprocessing
 import numpy as np
 import pprint as pp
 import pandas as pd
 import os.path
-import gensim.downloader as api
-from gensim.models import KeyedVectors
-from gensim.test.utils import datapath, get_tmpfile
-from gensim.scripts.glove2word2vec import glove2word2vec
 import config
 import utils
+import kv_cache
+import grammar_correction
 import dataloader 
 import progressbar
 import nltk
@@ -16,7 +14,6 @@ from nltk.corpus import stopwords
 from nltk.tokenize import word_tokenize
 from nltk.stem import WordNetLemmatizer
 from nltk.corpus import wordnet as wn
-import language_check
 
 maxInt = sys.maxsize
 decrement = True
@@ -33,48 +30,159 @@ lemmatizer = WordNetLemmatizer()
 stop_words = set(stopwords.words('english'))
 
 
-if not os.path.isfile(config.word_embed_gensim_file_path):
-    _ = glove2word2vec(config.word_embed_file_path, config.word_embed_gensim_file_path)
-glove_model = KeyedVectors.load_word2vec_format(config.word_embed_gensim_file_path)
+class AnalogyEngine():
+    # gensim most_similar_cosmul(positive=[to_class, word], negative=[from_class]) for a batch of words,
+    # with the normalised GloVe matrix computed once
 
-tool = language_check.LanguageTool('en-US')
+    def __init__(self, glove_store, glove_words, glove_index, batch_size=config.topic_translation_batch_size):
+        self.words = glove_words
+        self.index = glove_index
+        self.batch_size = batch_size
+        # normalised as in KeyedVectors.init_sims
+        self.vectors_norm = np.empty(glove_store.shape, dtype=np.float32)
+        for start in range(0, glove_store.shape[0], 50000):
+            block = np.asarray(glove_store[start : start + 50000], dtype=np.float64)
+            self.vectors_norm[start : start + 50000] = block / np.sqrt((block ** 2).sum(-1))[..., np.newaxis]
+
+    def class_dists(self, word):
+        return (1 + self.vectors_norm.dot(self.vectors_norm[self.index[word]])) / 2
+
+    def translate_ids(self, words, from_class, to_class, topn=config.topic_translation_topn):
+        # glove ids of the topn candidates of each word, best first
+        to_dist = self.class_dists(to_class)
+        from_dist = self.class_dists(from_class) + 0.000001
+        ans = []
+        for start in range(0, len(words), self.batch_size):
+            word_ids = [self.index[word] for word in words[start : start + self.batch_size]]
+            word_dists = (1 + self.vectors_norm.dot(self.vectors_norm[word_ids].T)) / 2
+            dists = (to_dist[:, np.newaxis] * word_dists) / from_dist[:, np.newaxis]
+
+            # the query words themselves are skipped, so take up to 3 more
+            best = np.argpartition(-dists, topn + 3, axis=0)[:topn + 3]
+            for col, word_id in enumerate(word_ids):
+                all_words = {self.index[to_class], self.index[from_class], word_id}
+                col_best = best[:, col]
+                col_best = col_best[np.argsort(-dists[col_best, col])]
+                ans.append([idx for idx in col_best if idx not in all_words][:topn])
+        return ans
+
+    def translate(self, words, from_class, to_class, topn=config.topic_translation_topn):
+        return [[self.words[idx] for idx in ids] for ids in self.translate_ids(words, from_class, to_class, topn)]
+
+
+glove_store, glove_words, glove_index = dataloader.load_glove_store(config.word_embed_file_path)
+analogy_engine = AnalogyEngine(glove_store, glove_words, glove_index)
+del glove_store
 
 pos_dict = {'JJ': 'a', 'JJR': 'a', 'JJS': 'a',
            'NN': 'n', 'NNP': 'n', 'NNPS': 'n', 'NNS': 'n',
            'RB': 'r', 'RBR': 'r', 'RBS': 'r',
            'VB': 'v', 'VBD': 'v', 'VBG': 'v', 'VBN': 'v', 'VBP': 'v', 'VBZ': 'v'}
 
-POS_OF_WORD = dict()
-WORD_TOPIC_TRANSLATION = dict()
+POS_OF_WORD = kv_cache.PersistentCache(config.augment_cache_path, "pos_of_word")
+WORD_TOPIC_TRANSLATION = kv_cache.PersistentCache(config.augment_cache_path, "word_topic_translation") # "from_class-to_class\tword" -> candidates
+TRANSLATION_TABLES = dict() # from_class-to_class -> (no. of table words, topn) glove ids, -1 for padding
+TABLE_WORD_INDEX = dict()
+TEXT_ANALYSIS = dict() # md5 of text -> analyse_text(text), persistent when augment_train is given an analysis_path
 
 
 def pos_list_of(word):
-    global POS_OF_WORD
     if word not in POS_OF_WORD:
         POS_OF_WORD[word] = [ss.pos() for ss in wn.synsets(word)]
     return POS_OF_WORD[word]
 
 def word_list_translation(word, from_class, to_class):
-    global WORD_TOPIC_TRANSLATION
     word = word.lower()
     key = from_class+'-'+to_class
-    if key not in WORD_TOPIC_TRANSLATION:
-        WORD_TOPIC_TRANSLATION[key] = dict()
-    if word not in WORD_TOPIC_TRANSLATION[key]:
-        WORD_TOPIC_TRANSLATION[key][word] = [x[0] for x in glove_model.most_similar_cosmul(positive=[to_class, word], negative=[from_class], topn = 20)]
-    return WORD_TOPIC_TRANSLATION[key][word]
+    if key in TRANSLATION_TABLES and word in TABLE_WORD_INDEX:
+        return [glove_words[idx] for idx in TRANSLATION_TABLES[key][TABLE_WORD_INDEX[word]] if idx >= 0]
+    cache_key = key + '\t' + word
+    if cache_key not in WORD_TOPIC_TRANSLATION:
+        WORD_TOPIC_TRANSLATION[cache_key] = analogy_engine.translate([word], from_class, to_class)[0]
+    return WORD_TOPIC_TRANSLATION[cache_key]
+
+def get_table_words(vocab_path): # vocab words that topic_transfer may translate
+    with open(vocab_path, 'r', encoding="utf8") as f:
+        words = [line.split()[0].lower() for line in f if len(line.split()) > 0]
+    return sorted(set(word for word in words if word not in stop_words and word in glove_index))
+
+def get_translation_table_meta(table_words, topn):
+    # the tables of table_dir are only valid for the same words, topn and GloVe vectors
+    matrix_file = dataloader.get_glove_store_paths(config.word_embed_file_path)[0]
+    return {"words": hashlib.md5("\n".join(table_words).encode("utf-8")).hexdigest(),
+            "topn": topn,
+            "embedding": [os.path.abspath(matrix_file), os.stat(matrix_file).st_size, int(os.stat(matrix_file).st_mtime),
+                          len(glove_words), int(analogy_engine.vectors_norm.shape[1])]}
+
+def load_translation_tables(class_dict, vocab_path, table_dir, topn=config.topic_translation_topn):
+    # one table per (from_class, to_class), rows follow words.txt; missing tables are built
+    global TRANSLATION_TABLES, TABLE_WORD_INDEX
+    if not os.path.exists(table_dir):
+        os.makedirs(table_dir)
+    words_file = table_dir + "words.txt"
+    meta_file = table_dir + "meta.json"
+    table_words = get_table_words(vocab_path)
+    meta = get_translation_table_meta(table_words, topn)
+    saved_meta = None
+    if os.path.exists(meta_file):
+        with open(meta_file) as f:
+            saved_meta = json.load(f)
+    if saved_meta != meta:
+        if saved_meta is not None:
+            print("Topic translation tables in %s are out of date, rebuilding ..." % table_dir)
+        for filename in os.listdir(table_dir):
+            if filename.endswith(".npy"):
+                os.remove(table_dir + filename)
+        with open(words_file, 'w', encoding="utf8") as f:
+            f.write("\n".join(table_words))
+        # meta last: it marks words.txt and the tables built after it as valid
+        with open(meta_file + ".tmp", 'w') as f:
+            json.dump(meta, f, indent=1)
+        os.replace(meta_file + ".tmp", meta_file)
+    TABLE_WORD_INDEX = dict(zip(table_words, range(len(table_words))))
+
+    class_names = [class_dict[class_id].lower() for class_id in sorted(class_dict)]
+    print("Loading topic translation tables of %d words ..." % len(table_words))
+    with progressbar.ProgressBar(max_value=len(class_names) ** 2) as bar:
+        for fidx, from_class in enumerate(class_names):
+            for tidx, to_class in enumerate(class_names):
+                bar.update(fidx * len(class_names) + tidx)
+                if from_class == to_class:
+                    continue
+                key = from_class + '-' + to_class
+                table_file = table_dir + key + ".npy"
+                if not os.path.exists(table_file):
+                    table = np.full((len(table_words), topn), -1, dtype=np.int32)
+                    for row, ids in enumerate(analogy_engine.translate_ids(table_words, from_class, to_class, topn)):
+                        table[row, :len(ids)] = ids
+                    np.save(table_file + ".tmp.npy", table)
+                    os.replace(table_file + ".tmp.npy", table_file)
+                TRANSLATION_TABLES[key] = np.load(table_file, mmap_mode="r")
+
+def analyse_text(text):
+    # the part of topic_transfer that does not depend on the classes: (token, pos tag, can be replaced)
+    pos_original_tokens = nltk.pos_tag(word_tokenize(text))
+    return [(token[0], token[1], not (token[0].lower() in stop_words or token[1] not in pos_dict or token[0].lower() not in glove_index))
+            for token in pos_original_tokens]
+
+def get_text_analysis(text):
+    global TEXT_ANALYSIS
+    key = hashlib.md5(text.encode("utf-8")).hexdigest()
+    if key not in TEXT_ANALYSIS:
+        TEXT_ANALYSIS[key] = analyse_text(text)
+    return TEXT_ANALYSIS[key]
 
 def topic_transfer(text, from_class, to_class):
+    return grammar_correction.correct(rewrite_text(analyse_text(text), from_class, to_class))
+
+def rewrite_text(analysis, from_class, to_class): # analysis from analyse_text(), the result is not grammar corrected
     from_class = from_class.lower()
     to_class = to_class.lower()
 
-    original_tokens = word_tokenize(text)
-    pos_original_tokens = nltk.pos_tag(original_tokens)
-    
     transferred_tokens = []
     replace_dict = dict()
-    for token in pos_original_tokens:
-        if token[0].lower() in stop_words or token[1] not in pos_dict or token[0].lower() not in glove_model.vocab:
+    for token in analysis:
+        if not token[2]:
             transferred_tokens.append(token[0])
         elif token[0].lower() in replace_dict:
             replacement = replace_dict[token[0].lower()]
@@ -99,63 +207,150 @@ def topic_transfer(text, from_class, to_class):
                 transferred_tokens.append(token[0])
 
     ans_sentence = ' '.join(transferred_tokens)
-    matches = tool.check(ans_sentence)
-    ans_sentence = language_check.correct(ans_sentence, matches)
-    
     return ans_sentence
 
-def augment_train(class_label_path, train_augmented_path, train_path, nott):
-    global POS_OF_WORD, WORD_TOPIC_TRANSLATION
-    if os.path.isfile(config.POS_OF_WORD_path):
-        POS_OF_WORD = pickle.load(open(config.POS_OF_WORD_path, "rb"))
+AUGMENT_FIELDNAMES = ['No.','from_class', 'to_class', 'text']
+
+def import_legacy_caches():
+    # the pickled dicts of earlier versions are copied into the persistent caches once
+    if os.path.isfile(config.POS_OF_WORD_path) and POS_OF_WORD.is_empty():
+        print("Importing %s ..." % config.POS_OF_WORD_path)
+        POS_OF_WORD.update(pickle.load(open(config.POS_OF_WORD_path, "rb")).items())
+        POS_OF_WORD.flush()
+    if os.path.isfile(config.WORD_TOPIC_TRANSLATION_path) and WORD_TOPIC_TRANSLATION.is_empty():
+        print("Importing %s ..." % config.WORD_TOPIC_TRANSLATION_path)
+        for key, translations in pickle.load(open(config.WORD_TOPIC_TRANSLATION_path, "rb")).items():
+            WORD_TOPIC_TRANSLATION.update((key + '\t' + word, candidates) for word, candidates in translations.items())
+        WORD_TOPIC_TRANSLATION.flush()
+
+def save_augment_caches():
+    # only the entries added since the last call are written
+    POS_OF_WORD.flush()
+    WORD_TOPIC_TRANSLATION.flush()
+    if isinstance(TEXT_ANALYSIS, kv_cache.PersistentCache):
+        TEXT_ANALYSIS.flush()
+    grammar_correction.flush()
+
+def augment_rows(rows, class_dict, writer):
+    # translates each row into all the other classes, No. counts from 0
+    count = 0
+    with progressbar.ProgressBar(max_value=len(rows)) as bar:
+        for idx, row in enumerate(rows):
+            text = row['text']
+            class_id = int(row['class'])
+            class_name = class_dict[class_id]
+            try:
+                # tokenised and tagged once for all the target classes
+                analysis = get_text_analysis(text)
+            except:
+                continue
+
+            targets = []
+            sentences = []
+            for cidx in class_dict:
+                if cidx != int(row['class']):
+                    try:
+                        sentences.append(rewrite_text(analysis, from_class = class_name, to_class = class_dict[cidx]))
+                        targets.append(cidx)
+                    except:
+                        continue
+
+            # all the translations of a row are corrected in one batch
+            for cidx, sentence in zip(targets, grammar_correction.correct_batch(sentences)):
+                if sentence is None:
+                    continue
+                try:
+                    writer.writerow({'No.':count, 'from_class': class_id, 'to_class': cidx, 'text':sentence})
+                except UnicodeEncodeError: # the csv is latin-1, skip sentences it cannot hold
+                    continue
+                count += 1
+            bar.update(idx)    
+            if idx % 100 == 0:
+                save_augment_caches()
+    save_augment_caches()
+    return count
 
-    if os.path.isfile(config.WORD_TOPIC_TRANSLATION_path):
-        WORD_TOPIC_TRANSLATION = pickle.load(open(config.WORD_TOPIC_TRANSLATION_path, "rb"))
+def augment_shard(args):
+    # runs in a worker: the persistent caches are shared, each worker adds its new entries
+    shard_path, rows, class_dict = args
+    with open(shard_path, 'w', encoding="latin-1", newline='') as csvwritefile:
+        writer = csv.DictWriter(csvwritefile, fieldnames=AUGMENT_FIELDNAMES)
+        writer.writeheader()
+        count = augment_rows(rows, class_dict, writer)
+    grammar_correction.report()
+    return count
+
+def merge_augment_shards(shard_paths, train_augmented_path):
+    # concatenates the shards in order and renumbers No.
+    count = 0
+    with open(train_augmented_path, 'w', encoding="latin-1", newline='') as csvwritefile:
+        writer = csv.DictWriter(csvwritefile, fieldnames=AUGMENT_FIELDNAMES)
+        writer.writeheader()
+        for shard_path in shard_paths:
+            with open(shard_path, encoding="latin-1") as csvfile:
+                for row in csv.DictReader(csvfile):
+                    row['No.'] = count
+                    writer.writerow(row)
+                    count += 1
+    for shard_path in shard_paths:
+        os.remove(shard_path)
+    print("Merged %d shards into %s: %d texts" % (len(shard_paths), train_augmented_path, count))
+
+def augment_train(class_label_path, train_augmented_path, train_path, nott, vocab_path=None, table_dir=None, analysis_path=None, num_workers=config.prepro_num_workers):
+    global TEXT_ANALYSIS
+    import_legacy_caches()
+
+    if analysis_path is not None:
+        TEXT_ANALYSIS = kv_cache.PersistentCache(analysis_path, "text_analysis")
 
     class_dict = dataloader.load_class_dict(
         class_file=class_label_path,
         class_code_column="ClassCode",
         class_name_column="ClassWord"
     )
-    
-    fieldnames = ['No.','from_class', 'to_class', 'text']
-    csvwritefile = open(train_augmented_path, 'w', encoding="latin-1", newline='')
-    writer = csv.DictWriter(csvwritefile, fieldnames=fieldnames)
-    writer.writeheader()
 
+    if config.topic_translation_tables:
+        load_translation_tables(class_dict, vocab_path, table_dir)
 
     with open(train_path, encoding="latin-1") as csvfile:
         reader = csv.DictReader(csvfile)
         rows = list(reader)
+
+    if num_workers <= 1:
         random.shuffle(rows)
         if nott is not None: # no. of texts to be translated
             rows = rows[:min(nott, len(rows))]
-        count = 0
-        with progressbar.ProgressBar(max_value=len(rows)) as bar:
-            for idx, row in enumerate(rows):
-                text = row['text']
-                class_id = int(row['class'])
-                class_name = class_dict[class_id]
-
-                for cidx in class_dict:
-                    if cidx != int(row['class']):
-                        try:
-                            writer.writerow({'No.':count, 'from_class': class_id, 'to_class': cidx, 'text':topic_transfer(text, from_class = class_name, to_class = class_dict[cidx])})
-                            count += 1
-                        except:
-                            continue
-                bar.update(idx)    
-                if idx % 100 == 0:
-                    pickle.dump(POS_OF_WORD, open(config.POS_OF_WORD_path, "wb"))
-                    pickle.dump(WORD_TOPIC_TRANSLATION, open(config.WORD_TOPIC_TRANSLATION_path, "wb"))
-    csvwritefile.close()
+        csvwritefile = open(train_augmented_path, 'w', encoding="latin-1", newline='')
+        writer = csv.DictWriter(csvwritefile, fieldnames=AUGMENT_FIELDNAMES)
+        writer.writeheader()
+        augment_rows(rows, class_dict, writer)
+        csvwritefile.close()
+        grammar_correction.report()
+        grammar_correction.close()
+        return
+
+    # - Sharded: a fixed seed makes the rows of each shard reproducible
+    random.Random(config.augment_seed).shuffle(rows)
+    if nott is not None: # no. of texts to be translated
+        rows = rows[:min(nott, len(rows))]
+    shard_size = int(math.ceil(len(rows) / num_workers))
+    shard_paths = ["%s.shard%d" % (train_augmented_path, shard) for shard in range(num_workers)]
+    shard_args = [(shard_paths[shard], rows[shard * shard_size : (shard + 1) * shard_size], class_dict) for shard in range(num_workers)]
+    print("Augmenting %d texts in %d shards" % (len(rows), num_workers))
+    save_augment_caches() # nothing pending is copied into the workers
+    with multiprocessing.Pool(num_workers) as pool:
+        shard_counts = pool.map(augment_shard, shard_args)
+    print("No. of texts per shard:", shard_counts)
+    merge_augment_shards(shard_paths, train_augmented_path)
 
 if __name__ == "__main__":
     print(config.dataset, config.args.nott)
     if config.dataset == "dbpedia":
-        augment_train(config.zhang15_dbpedia_class_label_path, config.zhang15_dbpedia_train_augmented_aggregated_path, config.zhang15_dbpedia_train_path, config.args.nott)
+        augment_train(config.zhang15_dbpedia_class_label_path, config.zhang15_dbpedia_train_augmented_aggregated_path, config.zhang15_dbpedia_train_path, config.args.nott,
+                      config.zhang15_dbpedia_vocab_path, config.zhang15_dbpedia_translation_table_dir, config.zhang15_dbpedia_train_analysis_path)
     elif config.dataset == "20news":
-        augment_train(config.news20_class_label_path, config.news20_train_augmented_aggregated_path, config.news20_train_path, config.args.nott)
+        augment_train(config.news20_class_label_path, config.news20_train_augmented_aggregated_path, config.news20_train_path, config.args.nott,
+                      config.news20_vocab_path, config.news20_translation_table_dir, config.news20_train_analysis_path)
     else:
         raise Exception("config.dataset %s not found" % config.dataset)
     pass
@@ -26,10 +26,54 @@ import dataloader
 
 results_path = "../results/"
 
+def bucket_order(train_order, text_seqs, batch_size=config.batch_size, window=config.bucket_window):
+    # reorder a shuffled order so that each batch holds texts of similar length: texts are sorted by
+    # length within windows of `window` batches, then the full batches are shuffled (a partial one stays last)
+    batch_list = list()
+    for start in range(0, len(train_order), batch_size * window):
+        window_order = sorted(train_order[start : start + batch_size * window], key=lambda idx: len(text_seqs[idx]))
+        batch_list.extend([window_order[idx : idx + batch_size] for idx in range(0, len(window_order), batch_size)])
+    last_batch = batch_list.pop() if len(batch_list) > 0 and len(batch_list[-1]) < batch_size else list()
+    random.shuffle(batch_list)
+    return [idx for batch in batch_list for idx in batch] + last_batch
+
+class BatchPipeline():
+    # tf.data pipeline over a list of batch plans: batch_fn(plan) builds the numpy arrays for
+    # feed_keys in parallel threads and the next batches are prefetched while sess.run is busy
+
+    def __init__(self, sess, feed_keys, batch_fn, num_parallel_calls=config.pipeline_num_parallel_calls, prefetch=config.pipeline_prefetch):
+        self.sess = sess
+        self.feed_keys = feed_keys
+        self.batch_fn = batch_fn
+        self.dtypes = [key.dtype for key in feed_keys]
+        self.plan_list = list()
+
+        self.num_steps = tf.placeholder(tf.int64, shape=[])
+        dataset = tf.data.Dataset.range(self.num_steps)
+        dataset = dataset.map(
+            lambda step: tf.py_func(self.get_batch, [step], self.dtypes, stateful=False),
+            num_parallel_calls=num_parallel_calls
+        )
+        dataset = dataset.prefetch(prefetch)
+        self.iterator = dataset.make_initializable_iterator()
+        self.next_batch = self.iterator.get_next()
+
+    def get_batch(self, step):
+        batch = self.batch_fn(self.plan_list[step])
+        return [np.asarray(value, dtype=dtype.as_numpy_dtype) for value, dtype in zip(batch, self.dtypes)]
+
+    def iterate_feed_dicts(self, plan_list):
+        self.plan_list = plan_list
+        self.sess.run(self.iterator.initializer, feed_dict={self.num_steps: len(plan_list)})
+        for _ in range(len(plan_list)):
+            yield dict(zip(self.feed_keys, self.sess.run(self.next_batch)))
+        self.plan_list = list()
+
 class Base_Controller():
 
     def __init__(self, model, gpu_config=None):
         self.model = model
+        self.pipelines = dict()
         self.saver = tf.train.Saver(max_to_keep=200)
         if gpu_config is None:
             self.sess = tf.Session()
@@ -52,6 +96,45 @@ class Base_Controller():
         ]
         utils.make_dirlist(dirlist)
 
+    def iterate_feed_dicts(self, feed_keys, batch_fn, plan_list):
+        # feed_dict of each batch plan in order, built inline or by a tf.data pipeline (config.input_pipeline);
+        # all random draws are made in the plans, so both ways give the same batches
+        if not config.input_pipeline:
+            for plan in plan_list:
+                yield dict(zip(feed_keys, batch_fn(plan)))
+        else:
+            # one pipeline per batch function, the graph ops are created only once
+            if batch_fn.__name__ not in self.pipelines:
+                self.pipelines[batch_fn.__name__] = BatchPipeline(self.sess, feed_keys, batch_fn)
+            pipeline = self.pipelines[batch_fn.__name__]
+            assert pipeline.feed_keys == feed_keys
+            for feed_dict in pipeline.iterate_feed_dicts(plan_list):
+                yield feed_dict
+
+    def init_word_embed(self, word_embed_mat):
+        # the in-graph embedding is a local variable, assigned once per session
+        if config.embedding_in_graph:
+            self.sess.run(self.model.word_embed.initializer, feed_dict={self.model.word_embed_init: word_embed_mat})
+
+    def get_text_feed_key(self):
+        return self.model.encode_ids if config.embedding_in_graph else self.model.encode_seqs
+
+    def get_text_feed_value(self, encode_seqs_id, encode_seqs_mat):
+        return encode_seqs_id if config.embedding_in_graph else encode_seqs_mat
+
+    def bucket_feed_dict(self, feed_dict, textlist):
+        # bucket batching: inputs with a variable time axis are cut to the longest text of the batch
+        # (plus the trailing padding of prepro_encode) and seq_len masks the rest in global max pooling
+        if not config.bucket_batching:
+            return feed_dict
+        seq_len = np.array([min(len(text) - 2, self.model.max_length - 1) for text in textlist])
+        length = min(np.max(seq_len) + 1, self.model.max_length)
+        for key in feed_dict:
+            if key.shape.ndims is not None and key.shape.ndims >= 2 and key.shape[1].value is None:
+                feed_dict[key] = feed_dict[key][:, :length]
+        feed_dict[self.model.seq_len] = seq_len
+        return feed_dict
+
     def save_model(self, path, global_step=None):
         save_path = self.saver.save(self.sess, path, global_step=global_step)
         print("[S] Model saved in ckpt %s" % save_path)
@@ -27,6 +27,7 @@ import config
 import model_reject
 import train_base
 import dataloader
+import grammar_correction
 import pickle
 
 # results_path = "../results/Model4Reject" + "/" + datetime.now().strftime("%Y%m%d%H%M%S")
@@ -52,6 +53,7 @@ class Controller4Reject(train_base.Base_Controller):
         self.vocab = vocab
         self.class_dict = class_dict
         self.word_embed_mat = word_embed_mat
+        self.init_word_embed(self.word_embed_mat)
         self.main_class = model.main_class
         self.seen_classes = model.seen_classes
         self.unseen_classes = model.unseen_classes
@@ -62,15 +64,16 @@ class Controller4Reject(train_base.Base_Controller):
     def get_text_of_seen_class(self, text_seqs, class_list):
         print("Getting text of seen classes")
         assert len(text_seqs) == len(class_list), "Unequal numbers of texts and classes: %d, %d" % (len(text_seqs), len(class_list))
-        seen_text_seqs = list()
+        seen_idx_list = list()
         seen_class_list = list()
 
         with progressbar.ProgressBar(max_value=len(text_seqs)) as bar:
-            for idx, text in enumerate(text_seqs):
+            for idx in range(len(text_seqs)):
                 if self.check_seen(class_list[idx]):
-                    seen_text_seqs.append(text)
+                    seen_idx_list.append(idx)
                     seen_class_list.append(class_list[idx])
                 bar.update(idx)
+        seen_text_seqs = dataloader.select_text_seqs(text_seqs, seen_idx_list)
         assert len(seen_text_seqs) == len(seen_class_list)
         print("Text seqs of seen classes: %d" % len(seen_text_seqs))
         return seen_text_seqs, seen_class_list
@@ -147,18 +150,30 @@ class Controller4Reject(train_base.Base_Controller):
         assert all([i == 0.0 or i == 1.0 for i in ans_class_list])
         return text_seqs, ans_class_list
 
-    def prepro_encode(self, textlist):
-        newtextlist = list()
+    def get_random_startid(self, textlist):
+        startid_list = list()
         for idx, text in enumerate(textlist):
             if len(text[1:-1]) > self.model.max_length:
                 startid = 1 + randint(0, len(text[1:-1]) - self.model.max_length)
             else:
                 startid = 1
-            newtextlist.append(text[startid:-1] + [self.vocab.pad_id])
+            startid_list.append(startid)
+        return startid_list
+
+    def prepro_encode(self, textlist, startid_list=None):
+        if startid_list is None:
+            startid_list = self.get_random_startid(textlist)
+        newtextlist = list()
+        for idx, text in enumerate(textlist):
+            startid = startid_list[idx]
+            newtextlist.append(list(text[startid:-1]) + [self.vocab.pad_id])
         newtextlist = tl.prepro.pad_sequences(newtextlist, maxlen=self.model.max_length, dtype='int64', padding='post', truncating='post', value=self.vocab.pad_id)
         for idx, text in enumerate(newtextlist):
             newtextlist[idx] = text[:-1] + [self.vocab.pad_id]
 
+        if config.embedding_in_graph:
+            return np.array(newtextlist), None
+
         text_array = np.zeros((len(newtextlist), self.model.max_length, self.model.word_embedding_dim))
         for idx, text in enumerate(newtextlist):
             for widx, word_id in enumerate(text):
@@ -211,16 +226,26 @@ class Controller4Reject(train_base.Base_Controller):
                     transferred_tokens.append(token[0])
 
         ans_sentence = ' '.join(transferred_tokens)
-        matches = tool.check(ans_sentence)
-        ans_sentence = language_check.correct(ans_sentence, matches)
+        ans_sentence = grammar_correction.correct(ans_sentence)
 
         return ans_sentence
 
+    def plan_train_batch(self, text_seqs, class_list, idx_list):
+        class_idx_mini = [class_list[idx] for idx in idx_list]
+        text_seqs_mini = [text_seqs[idx] for idx in idx_list]
+        return {"text_seqs": text_seqs_mini, "class_idx": class_idx_mini, "startid": self.get_random_startid(text_seqs_mini)}
+
+    def get_train_batch(self, plan):
+        encode_seqs_id_mini, encode_seqs_mat_mini = self.prepro_encode(plan["text_seqs"], plan["startid"])
+        return [self.get_text_feed_value(encode_seqs_id_mini, encode_seqs_mat_mini), np.array(plan["class_idx"]).reshape(-1,1)]
+
     def __train__(self, epoch, text_seqs, class_list, pos_text_seqs = None, neg_text_seqs = None, max_train_steps=None):
         assert len(text_seqs) == len(class_list)
 
         train_order = list(range(len(text_seqs)))
         random.shuffle(train_order)
+        if config.bucket_batching:
+            train_order = train_base.bucket_order(train_order, text_seqs)
 
         # anc_order = list(range(len(pos_text_seqs)))
         # pos_order = list(range(len(pos_text_seqs)))
@@ -245,13 +270,17 @@ class Controller4Reject(train_base.Base_Controller):
 
         logits_of_positive_examples = np.array([]).reshape(-1,1)
 
+        plan_list = list()
         for cstep in range(train_steps):
-            global_step = cstep + epoch * train_steps
+            plan_list.append(self.plan_train_batch(text_seqs, class_list, train_order[cstep * config.batch_size : min((cstep + 1) * config.batch_size, len(text_seqs))]))
 
-            class_idx_mini = [class_list[idx] for idx in train_order[cstep * config.batch_size : min((cstep + 1) * config.batch_size, len(text_seqs))]]
-            text_seqs_mini = [text_seqs[idx] for idx in train_order[cstep * config.batch_size : min((cstep + 1) * config.batch_size, len(text_seqs))]]
+        feed_keys = [self.get_text_feed_key(), self.model.label_logits]
+        for cstep, feed_dict in enumerate(self.iterate_feed_dicts(feed_keys, self.get_train_batch, plan_list)):
+            global_step = cstep + epoch * train_steps
 
-            encode_seqs_id_mini, encode_seqs_mat_mini = self.prepro_encode(text_seqs_mini)
+            class_idx_mini = plan_list[cstep]["class_idx"]
+            feed_dict[self.model.global_step] = global_step
+            feed_dict = self.bucket_feed_dict(feed_dict, plan_list[cstep]["text_seqs"])
 
             # anc_seqs_mini = [pos_text_seqs[idx] for idx in anc_order[(cstep * config.batch_size) % len(pos_text_seqs): min((cstep * config.batch_size) % len(pos_text_seqs) + config.batch_size, len(pos_text_seqs))]]
             # pos_seqs_mini = [pos_text_seqs[idx] for idx in pos_order[(cstep * config.batch_size) % len(pos_text_seqs): min((cstep * config.batch_size) % len(pos_text_seqs) + config.batch_size, len(pos_text_seqs))]]
@@ -277,14 +306,7 @@ class Controller4Reject(train_base.Base_Controller):
                 # self.model.train_align.outputs,
                 self.model.learning_rate,
                 self.model.optim
-            ], feed_dict={
-                self.model.encode_seqs: encode_seqs_mat_mini,
-                # self.model.encode_seqs_anc: encode_seqs_anc_mat_mini,
-                # self.model.encode_seqs_pos: encode_seqs_pos_mat_mini,
-                # self.model.encode_seqs_neg: encode_seqs_neg_mat_mini,
-                self.model.label_logits: np.array(class_idx_mini).reshape(-1,1),
-                self.model.global_step: global_step,
-            })
+            ], feed_dict=feed_dict)
 
             all_loss += results[:1]
             # all_cross_entropy_loss += results[2:3]
@@ -347,10 +369,10 @@ class Controller4Reject(train_base.Base_Controller):
             test_loss, out  = self.sess.run([
                 self.model.test_loss,
                 self.model.test_net.outputs,
-            ], feed_dict={
-                self.model.encode_seqs: encode_seqs_mat_mini,
+            ], feed_dict=self.bucket_feed_dict({
+                self.get_text_feed_key(): self.get_text_feed_value(encode_seqs_id_mini, encode_seqs_mat_mini),
                 self.model.label_logits: np.array(class_idx_mini).reshape(-1,1)
-            })
+            }, text_seqs_mini))
 
             all_loss[0] += test_loss
 
@@ -746,6 +768,7 @@ if __name__ == "__main__":
                     seen_classes=seen_classes,
                     unseen_classes=unseen_classes,
                     max_length=max_length,
+                    vocab_size=vocab.unk_id + 1,
                 )
                 
                 ctl = Controller4Reject(
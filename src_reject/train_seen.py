@@ -50,6 +50,7 @@ class Controller4Seen(train_base.Base_Controller):
         self.vocab = vocab
         self.class_dict = class_dict
         self.word_embed_mat = word_embed_mat
+        self.init_word_embed(self.word_embed_mat)
 
         self.full_class_list = sorted(list(self.class_dict.keys()))
         self.full_class_map2index = dict()
@@ -90,15 +91,16 @@ class Controller4Seen(train_base.Base_Controller):
     def get_text_of_seen_class(self, text_seqs, class_list):
         print("Getting text of seen classes")
         assert len(text_seqs) == len(class_list)
-        seen_text_seqs = list()
+        seen_idx_list = list()
         seen_class_list = list()
 
         with progressbar.ProgressBar(max_value=len(text_seqs)) as bar:
-            for idx, text in enumerate(text_seqs):
+            for idx in range(len(text_seqs)):
                 if self.check_seen(class_list[idx]):
-                    seen_text_seqs.append(text)
+                    seen_idx_list.append(idx)
                     seen_class_list.append(class_list[idx])
                 bar.update(idx)
+        seen_text_seqs = dataloader.select_text_seqs(text_seqs, seen_idx_list)
         assert len(seen_text_seqs) == len(seen_class_list)
         print("Text seqs of seen classes: %d" % len(seen_text_seqs))
         return seen_text_seqs, seen_class_list
@@ -115,11 +117,14 @@ class Controller4Seen(train_base.Base_Controller):
             # else:
             #     startid = 1
             startid = 1
-            newtextlist.append(text[startid:-1] + [self.vocab.pad_id])
+            newtextlist.append(list(text[startid:-1]) + [self.vocab.pad_id])
         newtextlist = tl.prepro.pad_sequences(newtextlist, maxlen=self.model.max_length, dtype='int64', padding='post', truncating='post', value=self.vocab.pad_id)
         for idx, text in enumerate(newtextlist):
             newtextlist[idx] = text[:-1] + [self.vocab.pad_id]
 
+        if config.embedding_in_graph:
+            return np.array(newtextlist), None
+
         text_array = np.zeros((len(newtextlist), self.model.max_length, self.model.word_embedding_dim))
         for idx, text in enumerate(newtextlist):
             for widx, word_id in enumerate(text):
@@ -149,6 +154,15 @@ class Controller4Seen(train_base.Base_Controller):
                 one_hot_res[idx, class_id - 1] = 1
         return one_hot_res
 
+    def plan_train_batch(self, text_seqs, class_list, idx_list):
+        class_idx_mini = [self.seen_class_map2index[class_list[idx]] for idx in idx_list]
+        text_seqs_mini = [text_seqs[idx] for idx in idx_list]
+        return {"text_seqs": text_seqs_mini, "class_idx": class_idx_mini}
+
+    def get_train_batch(self, plan):
+        encode_seqs_id_mini, encode_seqs_mat_mini = self.prepro_encode(plan["text_seqs"], True)
+        return [self.get_text_feed_value(encode_seqs_id_mini, encode_seqs_mat_mini), np.array(plan["class_idx"])]
+
     def __train__(self, epoch, text_seqs, class_list, max_train_steps=None):
 
         assert len(text_seqs) == len(class_list)
@@ -167,26 +181,26 @@ class Controller4Seen(train_base.Base_Controller):
             train_steps = max_train_steps
 
         train_order = random.sample(range(len(text_seqs)), k=train_steps * config.batch_size)
+        if config.bucket_batching:
+            train_order = train_base.bucket_order(train_order, text_seqs)
 
+        plan_list = list()
         for cstep in range(train_steps):
-            global_step = cstep + epoch * train_steps
-
-            class_idx_mini = [self.seen_class_map2index[class_list[idx]] for idx in train_order[cstep * config.batch_size : (cstep + 1) * config.batch_size]]
-            text_seqs_mini = [text_seqs[idx] for idx in train_order[cstep * config.batch_size : (cstep + 1) * config.batch_size]]
+            plan_list.append(self.plan_train_batch(text_seqs, class_list, train_order[cstep * config.batch_size : (cstep + 1) * config.batch_size]))
 
-            encode_seqs_id_mini, encode_seqs_mat_mini = self.prepro_encode(text_seqs_mini, True)
+        feed_keys = [self.get_text_feed_key(), self.model.category_target_index]
+        for cstep, feed_dict in enumerate(self.iterate_feed_dicts(feed_keys, self.get_train_batch, plan_list)):
+            global_step = cstep + epoch * train_steps
 
+            feed_dict[self.model.global_step] = global_step
+            feed_dict = self.bucket_feed_dict(feed_dict, plan_list[cstep]["text_seqs"])
             results = self.sess.run([
                 self.model.train_loss,
                 self.model.train_net.outputs,
                 # self.model.train_align.outputs,
                 self.model.learning_rate,
                 self.model.optim
-            ], feed_dict={
-                self.model.encode_seqs: encode_seqs_mat_mini,
-                self.model.category_target_index: np.array(class_idx_mini),
-                self.model.global_step: global_step,
-            })
+            ], feed_dict=feed_dict)
 
             all_loss += results[:1]
 
@@ -234,10 +248,10 @@ class Controller4Seen(train_base.Base_Controller):
             test_loss, out  = self.sess.run([
                 self.model.test_loss,
                 self.model.test_net.outputs,
-            ], feed_dict={
-                self.model.encode_seqs: encode_seqs_mat_mini,
+            ], feed_dict=self.bucket_feed_dict({
+                self.get_text_feed_key(): self.get_text_feed_value(encode_seqs_id_mini, encode_seqs_mat_mini),
                 self.model.category_target_index: class_idx_mini
-            })
+            }, text_seqs_mini))
 
             all_loss[0] += test_loss
 
@@ -471,7 +485,8 @@ def run_dbpedia():
                 decay_rate=0.5,
                 decay_steps=10e3,
                 max_length=max_length,
-                number_of_seen_classes=len(rgroup[0])
+                number_of_seen_classes=len(rgroup[0]),
+                vocab_size=vocab.unk_id + 1,
             )
             # TODO: if unseen_classes are already selected, set randon_unseen_class=False and provide a list of unseen_classes
             gpu_config = tf.ConfigProto()
@@ -588,7 +603,8 @@ def run_20news():
                 decay_rate=0.5,
                 decay_steps=600,
                 max_length=max_length,
-                number_of_seen_classes=len(rgroup[0])
+                number_of_seen_classes=len(rgroup[0]),
+                vocab_size=vocab.unk_id + 1,
             )
             # TODO: if unseen_classes are already selected, set randon_unseen_class=False and provide a list of unseen_classes
             gpu_config = tf.ConfigProto()
@@ -678,7 +694,8 @@ def run_amazon():
                 decay_rate=0.5,
                 decay_steps=10000,
                 max_length=max_length,
-                number_of_seen_classes=len(rgroup[0])
+                number_of_seen_classes=len(rgroup[0]),
+                vocab_size=vocab.unk_id + 1,
             )
             ctl = Controller4Seen(
                 model=mdl,
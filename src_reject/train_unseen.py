@@ -42,7 +42,8 @@ class Controller4Unseen(train_base.Base_Controller):
             random_percentage=0.25,
             random_unseen_class_list=None,
             base_epoch=-1,
-            lemma=False
+            lemma=False,
+            kg_vector_table_file=None
     ):
         super(Controller4Unseen, self).__init__(model, gpu_config)
 
@@ -54,12 +55,21 @@ class Controller4Unseen(train_base.Base_Controller):
         self.class_dict = class_dict
         self.kg_vector_dict = kg_vector_dict
         self.word_embed_mat = word_embed_mat
+        self.init_word_embed(self.word_embed_mat)
         self.lemma = lemma
 
         if self.lemma:
             from nltk.stem import WordNetLemmatizer
             self.lemmatizer = WordNetLemmatizer
 
+        if kg_vector_table_file is not None and len(self.kg_vector_dict) > 0:
+            self.kg_class_index = dict(zip(sorted(self.class_dict.keys()), range(len(self.class_dict))))
+            self.kg_vector_table = dataloader.load_kg_vector_table(
+                self.kg_vector_dict, self.class_dict, self.vocab, kg_vector_table_file, word_fn=self.get_kg_word
+            )
+        else:
+            self.kg_vector_table = None
+
         if random_unseen_class:
             num_class = len(class_dict.keys())
             num_unseen_class = int(num_class * random_percentage)
@@ -84,15 +94,16 @@ class Controller4Unseen(train_base.Base_Controller):
     def get_text_of_seen_class(self, text_seqs, class_list):
         print("Getting text of seen classes")
         assert len(text_seqs) == len(class_list)
-        seen_text_seqs = list()
+        seen_idx_list = list()
         seen_class_list = list()
 
         with progressbar.ProgressBar(max_value=len(text_seqs)) as bar:
-            for idx, text in enumerate(text_seqs):
+            for idx in range(len(text_seqs)):
                 if self.check_seen(class_list[idx]):
-                    seen_text_seqs.append(text)
+                    seen_idx_list.append(idx)
                     seen_class_list.append(class_list[idx])
                 bar.update(idx)
+        seen_text_seqs = dataloader.select_text_seqs(text_seqs, seen_idx_list)
         assert len(seen_text_seqs) == len(seen_class_list)
         print("Text seqs of seen classes: %d" % len(seen_text_seqs))
         return seen_text_seqs, seen_class_list
@@ -100,7 +111,7 @@ class Controller4Unseen(train_base.Base_Controller):
     def get_text_of_unseen_class(self, text_seqs, class_list, augdata=False):
         print("Getting text of unseen classes")
         assert len(text_seqs) == len(class_list)
-        unseen_text_seqs = list()
+        unseen_idx_list = list()
         unseen_class_list = list()
 
         unseen_class_counter = dict()
@@ -108,7 +119,7 @@ class Controller4Unseen(train_base.Base_Controller):
             unseen_class_counter[c] = 0
 
         with progressbar.ProgressBar(max_value=len(text_seqs)) as bar:
-            for idx, text in enumerate(text_seqs):
+            for idx in range(len(text_seqs)):
                 if not self.check_seen(class_list[idx]):
 
                     # control the number of augmented data
@@ -117,9 +128,10 @@ class Controller4Unseen(train_base.Base_Controller):
 
                     unseen_class_counter[class_list[idx]] += 1
 
-                    unseen_text_seqs.append(text)
+                    unseen_idx_list.append(idx)
                     unseen_class_list.append(class_list[idx])
                 bar.update(idx)
+        unseen_text_seqs = dataloader.select_text_seqs(text_seqs, unseen_idx_list)
         assert len(unseen_text_seqs) == len(unseen_class_list)
         print("Text seqs of unseen classes: %d" % len(unseen_text_seqs))
         if augdata:
@@ -134,11 +146,14 @@ class Controller4Unseen(train_base.Base_Controller):
             # else:
             #     startid = 1
             startid = 1
-            newtextlist.append(text[startid:-1] + [self.vocab.pad_id])
+            newtextlist.append(list(text[startid:-1]) + [self.vocab.pad_id])
         newtextlist = tl.prepro.pad_sequences(newtextlist, maxlen=self.model.max_length, dtype='int64', padding='post', truncating='post', value=self.vocab.pad_id)
         for idx, text in enumerate(newtextlist):
             newtextlist[idx] = text[:-1] + [self.vocab.pad_id]
 
+        if config.embedding_in_graph:
+            return np.array(newtextlist), None
+
         text_array = np.zeros((len(newtextlist), self.model.max_length, self.model.word_embedding_dim))
         for idx, text in enumerate(newtextlist):
             for widx, word_id in enumerate(text):
@@ -146,10 +161,12 @@ class Controller4Unseen(train_base.Base_Controller):
 
         return np.array(newtextlist), text_array
 
-    def get_random_text(self, num):
+    def get_random_text(self, num, length=None):
+        if length is None:
+            length = self.model.max_length
         random_text = list()
         for i in range(num):
-            text = [randint(0, self.vocab.unk_id) for _ in range(self.model.max_length)]
+            text = [randint(0, self.vocab.unk_id) for _ in range(length)]
             random_text.append(text)
         return random_text
 
@@ -181,6 +198,23 @@ class Controller4Unseen(train_base.Base_Controller):
 
         return class_embed
 
+    def get_class_label_feed_key(self):
+        return self.model.class_label_ids if config.embedding_in_graph else self.model.class_label_seqs
+
+    def get_class_label_feed_value(self, class_id_list):
+        # word ids of the class labels, or their embedding repeated along the text
+        if config.embedding_in_graph:
+            return np.array([self.vocab.word_to_id(self.class_dict[class_id]) for class_id in class_id_list])
+        return self.get_class_label_embed(class_id_list)
+
+    def get_kg_word(self, word):
+        if self.lemma:
+            new_word = nltk.pos_tag([word])  # a list of words à a list of words with part of speech
+            new_word = [self.lemmatizer.lemmatize(t[0], config.pos_dict[t[1]]) for t in new_word if t[1] in config.pos_dict]
+            if len(new_word) > 0:
+                word = new_word[0]
+        return word
+
     def get_kg_vector_given_class(self, encode_text_seqs, class_id_list):
 
         # TODO: remove to add kg_vector for training
@@ -188,24 +222,24 @@ class Controller4Unseen(train_base.Base_Controller):
 
         assert encode_text_seqs.shape[0] == class_id_list.shape[0]
 
-        kg_vector_list = list()
+        if self.kg_vector_table is not None:
+            class_idx_list = np.array([self.kg_class_index[class_id] for class_id in class_id_list])
+            kg_vector_list = self.kg_vector_table[class_idx_list[:, None], encode_text_seqs]
 
-        for idx, class_id in enumerate(class_id_list):
+        else:
+            kg_vector_list = list()
+
+            for idx, class_id in enumerate(class_id_list):
 
-            kg_vector = np.zeros([self.model.max_length, config.kg_embedding_dim])
+                kg_vector = np.zeros([self.model.max_length, config.kg_embedding_dim])
 
-            for widx, word_id in enumerate(encode_text_seqs[idx]):
-                word = self.vocab.id_to_word(word_id)
-                if self.lemma:
-                    new_word = nltk.pos_tag([word])  # a list of words à a list of words with part of speech
-                    new_word = [self.lemmatizer.lemmatize(t[0], config.pos_dict[t[1]]) for t in new_word if t[1] in config.pos_dict]
-                    if len(new_word) > 0:
-                        word = new_word[0]
-                kg_vector[widx, :] = dataloader.get_kg_vector(self.kg_vector_dict, self.class_dict[class_id], word)
+                for widx, word_id in enumerate(encode_text_seqs[idx]):
+                    word = self.get_kg_word(self.vocab.id_to_word(word_id))
+                    kg_vector[widx, :] = dataloader.get_kg_vector(self.kg_vector_dict, self.class_dict[class_id], word)
 
-            kg_vector_list.append(kg_vector)
+                kg_vector_list.append(kg_vector)
 
-        kg_vector_list = np.array(kg_vector_list)
+            kg_vector_list = np.array(kg_vector_list)
 
         assert kg_vector_list.shape == (config.batch_size, self.model.max_length, config.kg_embedding_dim)
 
@@ -233,6 +267,67 @@ class Controller4Unseen(train_base.Base_Controller):
                 one_hot_res[idx, class_id - 1] = 1
         return one_hot_res
 
+    def plan_train_batch(self, epoch, text_seqs, class_list, idx_list):
+        # all random draws of a training batch, in the order of the former inline loop
+
+        # category_logits = [1 if randint(0, config.negative_sample) == 0 else 0 for _ in range(config.batch_size)]
+        category_logits = [1 if randint(0, config.negative_sample + epoch * config.negative_increase) == 0 else 0 for _ in range(config.batch_size)]
+        # category_logits = [1 if randint(0, config.negative_sample + epoch * 3) == 0 else 0 for _ in range(config.batch_size)]
+
+        true_class_id_mini = [class_list[idx] for idx in idx_list]
+        text_seqs_mini = [text_seqs[idx] for idx in idx_list]
+
+        if not config.model == "autoencoder":
+            # random text
+            true_class_id_mini = true_class_id_mini[:-3]  + [-1, -1, -1]
+            # with bucket batching the random texts are not longer than the batch
+            random_length = min(max([len(text) for text in text_seqs_mini]), self.model.max_length) if config.bucket_batching else None
+            text_seqs_mini = text_seqs_mini[:-3] + self.get_random_text(3, random_length)
+        else:
+            tmpid = random.choice(list(self.class_dict.keys()))
+            text_seqs_mini = text_seqs_mini[:-1] + \
+                             [[self.vocab.start_id, self.vocab.word_to_id(self.class_dict[tmpid]), self.vocab.end_id]]
+
+        category_logits = category_logits[:-3] + [0, 0, 0]
+        class_id_mini = self.get_random_class(true_class_id_mini, category_logits)
+        # class_id_mini = np.array([class_id] * config.batch_size)
+        # category_logits = [int(class_id_mini[i] == true_class_id_mini[i]) for i in range(config.batch_size)]
+
+        return {"text_seqs": text_seqs_mini, "category_logits": category_logits, "class_id": class_id_mini}
+
+    def get_train_feed_keys(self):
+        if config.model == "cnnfc" or config.model == "rnnfc":
+            return [self.get_text_feed_key(), self.get_class_label_feed_key(), self.model.category_logits]
+        elif config.model == "autoencoder":
+            return [self.model.encode_seqs, self.model.decode_seqs, self.model.target_seqs, self.model.target_mask]
+        else:
+            return [self.get_text_feed_key(), self.get_class_label_feed_key(), self.model.kg_vector, self.model.category_logits]
+
+    def get_train_batch(self, plan):
+        # arrays in the order of get_train_feed_keys, no random draw in here
+        encode_seqs_id_mini, encode_seqs_mat_mini = self.prepro_encode(plan["text_seqs"])
+
+        if config.model == "autoencoder":
+            decode_seqs_mat_mini = np.concatenate(
+                (np.zeros(shape=(encode_seqs_mat_mini.shape[0], 1, encode_seqs_mat_mini.shape[2])),
+                 encode_seqs_mat_mini[:, :-1, :]),
+                axis=1
+            )
+            return [encode_seqs_mat_mini, decode_seqs_mat_mini, encode_seqs_id_mini, np.where(encode_seqs_id_mini == self.vocab.pad_id, 0, 1)]
+
+        encode_seqs_mini = self.get_text_feed_value(encode_seqs_id_mini, encode_seqs_mat_mini)
+        class_label_mini = self.get_class_label_feed_value(plan["class_id"])
+        category_logits = np.expand_dims(np.array(plan["category_logits"]), -1)
+
+        if config.model == "cnnfc" or config.model == "rnnfc":
+            return [encode_seqs_mini, class_label_mini, category_logits]
+
+        if config.model == "vwvc":
+            kg_vector_seqs_mini = np.zeros((config.batch_size, self.model.max_length, self.model.kg_embedding_dim))
+        else:
+            kg_vector_seqs_mini = self.get_kg_vector_given_class(encode_seqs_id_mini, plan["class_id"])
+        return [encode_seqs_mini, class_label_mini, kg_vector_seqs_mini, category_logits]
+
     def __train__(self, epoch, text_seqs, class_list, max_train_steps=None):
 
         assert len(text_seqs) == len(class_list)
@@ -251,86 +346,25 @@ class Controller4Unseen(train_base.Base_Controller):
             train_steps = max_train_steps
 
         train_order = random.sample(range(len(text_seqs)), k=train_steps * config.batch_size)
+        if config.bucket_batching:
+            train_order = train_base.bucket_order(train_order, text_seqs)
 
+        plan_list = list()
         for cstep in range(train_steps):
-            global_step = cstep + epoch * train_steps
-
-            # category_logits = [1 if randint(0, config.negative_sample) == 0 else 0 for _ in range(config.batch_size)]
-            category_logits = [1 if randint(0, config.negative_sample + epoch * config.negative_increase) == 0 else 0 for _ in range(config.batch_size)]
-            # category_logits = [1 if randint(0, config.negative_sample + epoch * 3) == 0 else 0 for _ in range(config.batch_size)]
-
-            true_class_id_mini = [class_list[idx] for idx in train_order[cstep * config.batch_size : (cstep + 1) * config.batch_size]]
-            text_seqs_mini = [text_seqs[idx] for idx in train_order[cstep * config.batch_size : (cstep + 1) * config.batch_size]]
-
-            if not config.model == "autoencoder":
-                # random text
-                true_class_id_mini = true_class_id_mini[:-3]  + [-1, -1, -1]
-                text_seqs_mini = text_seqs_mini[:-3] + self.get_random_text(3)
-            else:
-                tmpid = random.choice(list(self.class_dict.keys()))
-                text_seqs_mini = text_seqs_mini[:-1] + \
-                                 [[self.vocab.start_id, self.vocab.word_to_id(self.class_dict[tmpid]), self.vocab.end_id]]
-
-            encode_seqs_id_mini, encode_seqs_mat_mini = self.prepro_encode(text_seqs_mini)
-
-            # for class_id in seen_class_list:
-
-            category_logits = category_logits[:-3] + [0, 0, 0]
-            class_id_mini = self.get_random_class(true_class_id_mini, category_logits)
-            # class_id_mini = np.array([class_id] * config.batch_size)
-            # category_logits = [int(class_id_mini[i] == true_class_id_mini[i]) for i in range(config.batch_size)]
+            plan_list.append(self.plan_train_batch(epoch, text_seqs, class_list, train_order[cstep * config.batch_size : (cstep + 1) * config.batch_size]))
 
-            class_label_embed_mini = self.get_class_label_embed(class_id_mini)
-
-            if config.model == "cnnfc" or config.model == "rnnfc":
-                results = self.sess.run([
-                    self.model.train_loss,
-                    self.model.train_net.outputs,
-                    self.model.learning_rate,
-                    self.model.optim
-                ], feed_dict={
-                    self.model.encode_seqs: encode_seqs_mat_mini,
-                    self.model.class_label_seqs: class_label_embed_mini,
-                    self.model.category_logits: np.expand_dims(np.array(category_logits), -1),
-                    self.model.global_step: global_step,
-                })
-            elif config.model == "autoencoder":
-                decode_seqs_mat_mini = np.concatenate(
-                    (np.zeros(shape=(encode_seqs_mat_mini.shape[0], 1, encode_seqs_mat_mini.shape[2])),
-                     encode_seqs_mat_mini[:, :-1, :]),
-                    axis=1
-                )
-                results = self.sess.run([
-                    self.model.train_loss,
-                    self.model.train_net.outputs,
-                    self.model.learning_rate,
-                    self.model.optim
-                ], feed_dict={
-                    self.model.encode_seqs: encode_seqs_mat_mini,
-                    self.model.decode_seqs: decode_seqs_mat_mini,
-                    self.model.global_step: global_step,
-                    self.model.target_seqs: encode_seqs_id_mini,
-                    self.model.target_mask: np.where(encode_seqs_id_mini == self.vocab.pad_id, 0, 1)
-                })
+        for cstep, feed_dict in enumerate(self.iterate_feed_dicts(self.get_train_feed_keys(), self.get_train_batch, plan_list)):
+            global_step = cstep + epoch * train_steps
 
-            else:
-                if config.model == "vwvc":
-                    kg_vector_seqs_mini = np.zeros((config.batch_size, self.model.max_length, self.model.kg_embedding_dim))
-                else:
-                    kg_vector_seqs_mini = self.get_kg_vector_given_class(encode_seqs_id_mini, class_id_mini)
-                results = self.sess.run([
-                    self.model.train_loss,
-                    self.model.train_net.outputs,
-                    # self.model.train_align.outputs,
-                    self.model.learning_rate,
-                    self.model.optim
-                ], feed_dict={
-                    self.model.encode_seqs: encode_seqs_mat_mini,
-                    self.model.class_label_seqs: class_label_embed_mini,
-                    self.model.kg_vector: kg_vector_seqs_mini,
-                    self.model.category_logits: np.expand_dims(np.array(category_logits), -1),
-                    self.model.global_step: global_step,
-                })
+            feed_dict[self.model.global_step] = global_step
+            feed_dict = self.bucket_feed_dict(feed_dict, plan_list[cstep]["text_seqs"])
+            results = self.sess.run([
+                self.model.train_loss,
+                self.model.train_net.outputs,
+                # self.model.train_align.outputs,
+                self.model.learning_rate,
+                self.model.optim
+            ], feed_dict=feed_dict)
 
             all_loss += results[:1]
 
@@ -486,7 +520,7 @@ class Controller4Unseen(train_base.Base_Controller):
 
                 class_id_mini = np.array([class_id] * config.batch_size)
 
-                class_label_embed_mini = self.get_class_label_embed(class_id_mini)
+                class_label_mini = self.get_class_label_feed_value(class_id_mini)
 
                 category_logits = np.zeros([config.batch_size, 1])
                 for b in range(config.batch_size):
@@ -496,11 +530,11 @@ class Controller4Unseen(train_base.Base_Controller):
                     test_loss, pred  = self.sess.run([
                         self.model.test_loss,
                         self.model.test_net.outputs,
-                    ], feed_dict={
-                        self.model.encode_seqs: encode_seqs_mat_mini,
-                        self.model.class_label_seqs: class_label_embed_mini,
+                    ], feed_dict=self.bucket_feed_dict({
+                        self.get_text_feed_key(): self.get_text_feed_value(encode_seqs_id_mini, encode_seqs_mat_mini),
+                        self.get_class_label_feed_key(): class_label_mini,
                         self.model.category_logits: category_logits,
-                    })
+                    }, text_seqs_mini))
                 else:
                     if config.model == "vwvc":
                         kg_vector_seqs_mini = np.zeros((config.batch_size, self.model.max_length, self.model.kg_embedding_dim))
@@ -511,12 +545,12 @@ class Controller4Unseen(train_base.Base_Controller):
                         self.model.test_loss,
                         self.model.test_net.outputs,
                         # self.model.test_align.outputs,
-                    ], feed_dict={
-                        self.model.encode_seqs: encode_seqs_mat_mini,
-                        self.model.class_label_seqs: class_label_embed_mini,
+                    ], feed_dict=self.bucket_feed_dict({
+                        self.get_text_feed_key(): self.get_text_feed_value(encode_seqs_id_mini, encode_seqs_mat_mini),
+                        self.get_class_label_feed_key(): class_label_mini,
                         self.model.kg_vector: kg_vector_seqs_mini,
                         self.model.category_logits: category_logits,
-                    })
+                    }, text_seqs_mini))
 
                 # print(test_loss)
 
@@ -607,6 +641,11 @@ class Controller4Unseen(train_base.Base_Controller):
         for class_id in unseen_test_class_list:
             assert not self.check_seen(class_id)
 
+        if config.augmentation > 0:
+            # concatenated once, the augmented data is used from epoch 7 on
+            train_all_text_seqs = train_text_seqs + train_aug_text_seqs
+            train_all_class_list = train_class_list + train_aug_class_list
+
         for epoch in range(train_epoch + 1):
 
             # TODO: apply constrain on training set size
@@ -619,8 +658,8 @@ class Controller4Unseen(train_base.Base_Controller):
                     print("Training with augmentation %s" % (global_epoch > 6))
                     self.__train__(
                         global_epoch,
-                        train_text_seqs + train_aug_text_seqs if global_epoch > 6 else train_text_seqs,
-                        train_class_list + train_aug_class_list if global_epoch > 6 else train_class_list,
+                        train_all_text_seqs if global_epoch > 6 else train_text_seqs,
+                        train_all_class_list if global_epoch > 6 else train_class_list,
                         max_train_steps=1000
                     )
                 else:
@@ -931,6 +970,7 @@ def run_dbpedia():
                 kg_vector_dict=kg_vector_dict,
                 word_embed_mat=glove_mat,
                 lemma=True,
+                kg_vector_table_file=config.zhang15_dbpedia_kg_vector_table_path,
                 random_unseen_class=False,
                 random_unseen_class_list=rgroup[1],
                 base_epoch=-1,
@@ -1097,6 +1137,7 @@ def run_20news():
                 kg_vector_dict=kg_vector_dict,
                 word_embed_mat=glove_mat,
                 lemma=True,
+                kg_vector_table_file=config.news20_kg_vector_table_path,
                 random_unseen_class=False,
                 random_unseen_class_list=rgroup[1],
                 base_epoch=-1,